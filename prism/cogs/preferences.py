@@ -7,7 +7,7 @@ import discord
 from discord.commands import SlashCommandGroup, option
 from discord.utils import basic_autocomplete
 
-from ..services.user_preferences import VALID_EMOJI_DENSITIES, VALID_RESPONSE_LENGTHS
+from ..services.user_preferences import autocomplete_values
 
 
 log = logging.getLogger(__name__)
@@ -35,10 +35,8 @@ async def _preference_value_autocomplete(ctx: discord.AutocompleteContext):  # t
     preference = ctx.options.get("preference", "")
     query = (ctx.value or "").lower()
 
-    if preference == "response_length":
-        options = list(VALID_RESPONSE_LENGTHS)
-    elif preference == "emoji_density":
-        options = list(VALID_EMOJI_DENSITIES)
+    if preference in ("response_length", "emoji_density"):
+        return autocomplete_values(preference, query)
     elif preference == "preferred_persona":
         # Reuse persona autocomplete pattern from personas.py
         try:
@@ -69,11 +67,6 @@ async def _preference_value_autocomplete(ctx: discord.AutocompleteContext):  # t
         # Unknown preference, return empty
         return []
 
-    # Filter options by query
-    if query:
-        options = [opt for opt in options if query in opt.lower()]
-    return options
-
 
 class PreferencesCog(discord.Cog):
     def __init__(self, bot: discord.Bot):
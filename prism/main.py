@@ -63,29 +63,20 @@ def _format_sources(sources: list[dict]) -> str:
     """Format sources into a Sources: section for appending to replies."""
     if not sources:
         return ""
-    
-    # Filter and format valid sources
-    formatted_sources = []
-    for source in sources:
-        if not isinstance(source, dict):
-            continue
-        
-        # Try to extract URL and title from various possible formats
-        url = source.get("url") or source.get("link") or source.get("href")
-        title = source.get("title") or source.get("name")
-        
-        if url:
-            if title:
-                formatted_sources.append(f"- {title}: {url}")
-            else:
-                formatted_sources.append(f"- {url}")
-    
+
+    # Try to extract URL and title from various possible formats, skipping non-dict entries
+    pairs = (
+        (source.get("url") or source.get("link") or source.get("href"), source.get("title") or source.get("name"))
+        for source in sources
+        if isinstance(source, dict)
+    )
+    formatted_sources = [f"- {title}: {url}" if title else f"- {url}" for url, title in pairs if url]
+
     if not formatted_sources:
         return ""
-    
-    # Build the sources section
-    sources_text = "\n\n**Sources:**\n" + "\n".join(formatted_sources)
-    return sources_text
+
+    # Build the sources section in a single join
+    return "\n\n**Sources:**\n" + "\n".join(formatted_sources)
 
 
 def _clip_reply_to_limit(text: str) -> tuple[str, bool]:
@@ -126,6 +117,47 @@ def _clip_reply_to_limit(text: str) -> tuple[str, bool]:
     return truncated, True
 
 
+async def _close_bot(bot, close_task: asyncio.Task | None = None) -> None:
+    """Close the Discord bot and let aiohttp finish releasing its transports.
+
+    bot.close() closes py-cord's aiohttp session and connector outright; one
+    loop tick afterwards lets the transport close callbacks run, which avoids
+    "Unclosed client session" warnings without a fixed sleep.
+
+    ``close_task`` is a bot.close() already started elsewhere (the signal
+    handler). is_closed() turns True as soon as that close begins, long before
+    the aiohttp session is closed, so it is awaited rather than skipped.
+    """
+    if close_task is not None:
+        await close_task
+    elif not bot.is_closed():
+        await bot.close()
+    await asyncio.sleep(0)
+
+
+async def _shutdown(
+    bot, orc: OpenRouterClient, db: Database, close_task: asyncio.Task | None = None
+) -> None:
+    """Release the bot, HTTP client and database; errors are logged, not raised.
+
+    The bot closes first: until its gateway connection is down, events can
+    still start message handlers, and those use both the OpenRouter client and
+    the database. Once it is closed those two are independent and close
+    concurrently. ``close_task`` is passed through to _close_bot().
+    """
+    try:
+        await _close_bot(bot, close_task)
+    except Exception as e:
+        log.warning("Error closing Discord bot during shutdown: %s", e)
+
+    for name, result in zip(
+        ("OpenRouter client", "database"),
+        await asyncio.gather(orc.aclose(), db.close(), return_exceptions=True),
+    ):
+        if isinstance(result, Exception):
+            log.warning("Error closing %s during shutdown: %s", name, result)
+
+
 def build_bot(cfg):
     # Lazy import to avoid import-time failures on unsupported Python versions
     import discord  # type: ignore
@@ -380,23 +412,27 @@ def register_commands(bot, orc: OpenRouterClient, cfg) -> None:
                 # Initialize cmeta early so it's available for emoji enforcement later
                 cmeta: list[dict] = []
 
+                # Fetch user preferences once; persona, length and density all read from it
+                user_prefs = await bot.prism_user_prefs.get(message.author.id)  # type: ignore[attr-defined]
+
                 # Resolve persona: check user preference first, then fall back to guild default
-                user_persona = await bot.prism_user_prefs.resolve_preferred_persona(message.author.id)  # type: ignore[attr-defined]
-                if user_persona is not None:
-                    persona_name = user_persona
-                else:
-                    persona_name = await bot.prism_settings.resolve_persona_name(message.guild.id, message.channel.id, message.author.id)
+                user_persona = user_prefs["preferred_persona"]
+                persona_name = (
+                    await bot.prism_settings.resolve_persona_name(message.guild.id, message.channel.id, message.author.id)
+                    if user_persona is None
+                    else user_persona
+                )
                 persona = await bot.prism_personas.get(persona_name)
                 if not persona:
                     persona = await bot.prism_personas.get("default")
 
                 # Resolve response length preference from user preferences
-                response_length = await bot.prism_user_prefs.resolve_response_length(message.author.id)  # type: ignore[attr-defined]
+                response_length = user_prefs["response_length"]
                 length_guidance = RESPONSE_LENGTH_GUIDANCE.get(response_length, RESPONSE_LENGTH_GUIDANCE["balanced"])
                 max_tokens = RESPONSE_LENGTH_MAX_TOKENS.get(response_length)
 
                 # Resolve emoji density preference from user preferences
-                emoji_density = await bot.prism_user_prefs.resolve_emoji_density(message.author.id)  # type: ignore[attr-defined]
+                emoji_density = user_prefs["emoji_density"]
                 density_guidance = EMOJI_DENSITY_GUIDANCE.get(emoji_density, EMOJI_DENSITY_GUIDANCE["normal"])
 
                 base_rules = _load_base_guidelines_text()
@@ -602,7 +638,7 @@ def register_commands(bot, orc: OpenRouterClient, cfg) -> None:
                     # Emoji enforcement: ensure at least one emoji per sentence when enabled,
                     # spread them out, and avoid duplicate emoji tokens in a single message.
                     # Skip emoji enforcement entirely when user density is "none"
-                    if cfg.emoji_talk_enabled and emoji_density != "none":  # type: ignore[attr-defined]
+                    if cfg.emoji_talk_enabled and user_prefs["emoji_enforcement_enabled"]:  # type: ignore[attr-defined]
                         no_emoji_requested = any(w in content.lower() for w in ["no emoji", "no emojis", "without emoji", "without emojis"])
                         if not no_emoji_requested and reply:
                             custom_tokens = [m.get("token") for m in cmeta if str(m.get("token", "")).startswith("<")]
@@ -741,18 +777,20 @@ async def amain() -> None:
 
     # Install signal handlers for graceful shutdown (including SIGTERM)
     shutdown_requested = False
+    # bot.close() started by the signal handler; shutdown waits for it to finish
+    close_task: asyncio.Task | None = None
     try:
         import signal
         loop = asyncio.get_running_loop()
         def _graceful_signal(sig_name: str) -> None:
-            nonlocal shutdown_requested
+            nonlocal shutdown_requested, close_task
             if shutdown_requested:
                 return  # Prevent double-handling
             shutdown_requested = True
             try:
                 log.info("Received %s, requesting graceful shutdown...", sig_name)
                 # Request bot close - the finally block will handle the rest
-                loop.create_task(bot.close())
+                close_task = loop.create_task(bot.close())
             except Exception:
                 pass
         for _sig, _name in ((signal.SIGINT, "SIGINT"), (signal.SIGTERM, "SIGTERM")):
@@ -807,18 +845,7 @@ async def amain() -> None:
                     raise
     finally:
         # Close external resources regardless of exit path
-        try:
-            if not bot.is_closed():
-                await bot.close()
-            # Give aiohttp time to finish cleanup tasks to avoid "Unclosed client session" warnings
-            # This needs to happen even if bot was already closed to let background tasks complete
-            await asyncio.sleep(0.5)
-        except Exception:  # noqa: BLE001
-            pass
-        try:
-            await orc.aclose()
-        finally:
-            await db.close()
+        await _shutdown(bot, orc, db, close_task)
 
 
 def main() -> None:
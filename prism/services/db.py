@@ -15,6 +15,29 @@ log = logging.getLogger(__name__)
 _DB_RETRY_ATTEMPTS = 3
 _DB_RETRY_DELAY = 0.1  # seconds
 
+# Prepared-statement cache per connection (sqlite3 default is 128); every service
+# shares the one Database connection and reuses a fixed set of SQL strings
+_CACHED_STATEMENTS = 256
+
+
+async def _connect(path: str) -> aiosqlite.Connection:
+    return await aiosqlite.connect(path, cached_statements=_CACHED_STATEMENTS)
+
+
+async def _apply_pragmas(conn: aiosqlite.Connection) -> None:
+    """Apply the per-connection PRAGMAs every Database connection runs with."""
+    # Recommended PRAGMAs for better write performance with WAL
+    async with conn.execute("PRAGMA foreign_keys = ON;"):
+        pass
+    try:
+        # With WAL mode, NORMAL is a good balance of durability/perf
+        await conn.execute("PRAGMA synchronous = NORMAL;")
+        # Keep temp structures in memory to avoid disk I/O
+        await conn.execute("PRAGMA temp_store = MEMORY;")
+    except Exception:
+        # Ignore if unavailable
+        pass
+
 
 @dataclass
 class Database:
@@ -29,22 +52,12 @@ class Database:
             if parent_dir:
                 os.makedirs(parent_dir, exist_ok=True)
 
-        conn = await aiosqlite.connect(path)
+        conn = await _connect(path)
         conn.row_factory = aiosqlite.Row
         # Apply schema
         schema_path = os.path.join(os.path.dirname(__file__), "../storage/schema.sql")
         schema_path = os.path.normpath(schema_path)
-        # Recommended PRAGMAs for better write performance with WAL
-        async with conn.execute("PRAGMA foreign_keys = ON;"):
-            pass
-        try:
-            # With WAL mode, NORMAL is a good balance of durability/perf
-            await conn.execute("PRAGMA synchronous = NORMAL;")
-            # Keep temp structures in memory to avoid disk I/O
-            await conn.execute("PRAGMA temp_store = MEMORY;")
-        except Exception:
-            # Ignore if unavailable
-            pass
+        await _apply_pragmas(conn)
         # Read and apply schema
         if not os.path.isfile(schema_path):
             log.error("Schema file not found: %s", schema_path)
@@ -63,6 +76,22 @@ class Database:
         
         return cls(path=path, conn=conn)
 
+    async def copy(self, path: str = ":memory:") -> "Database":
+        """Open a new Database at ``path`` holding a page-level copy of this one.
+
+        Uses SQLite's online backup API, so the schema and migrations come
+        across as-is without being replayed.
+        """
+        conn = await _connect(path)
+        try:
+            await self.conn.backup(conn)
+            conn.row_factory = aiosqlite.Row
+            await _apply_pragmas(conn)
+        except Exception:
+            await conn.close()
+            raise
+        return type(self)(path=path, conn=conn)
+
     async def close(self) -> None:
         await self.conn.close()
 
@@ -83,6 +112,37 @@ class Database:
         if last_error:
             raise last_error
 
+    async def executemany(self, sql: str, params: Iterable[Iterable[Any]]) -> None:
+        """Execute a statement for each parameter set in one commit, with retry on database lock.
+
+        The batch is all-or-nothing: a failure on any row rolls back the rows
+        before it.
+        """
+        rows = [tuple(p) for p in params]
+        if not rows:
+            return
+        last_error: Exception | None = None
+        for attempt in range(_DB_RETRY_ATTEMPTS):
+            try:
+                await self.conn.executemany(sql, rows)
+                await self.conn.commit()
+                return
+            except Exception as e:
+                # Discard rows applied before the failure; left in the open
+                # transaction, the next commit on this connection would keep them
+                await self.conn.rollback()
+                if (
+                    isinstance(e, aiosqlite.OperationalError)
+                    and "locked" in str(e).lower()
+                    and attempt < _DB_RETRY_ATTEMPTS - 1
+                ):
+                    last_error = e
+                    await asyncio.sleep(_DB_RETRY_DELAY * (attempt + 1))
+                    continue
+                raise
+        if last_error:
+            raise last_error
+
     async def fetchone(self, sql: str, params: Iterable[Any] = ()) -> aiosqlite.Row | None:
         """Fetch one row with retry on database lock."""
         last_error: Exception | None = None
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import copy
 import json
 import logging
-from typing import Any
+from typing import Any, Iterable
 
 from .db import Database
 
@@ -15,12 +17,43 @@ DEFAULT_SETTINGS: dict[str, Any] = {
     "default_persona": "default",
 }
 
+# Upsert that only replaces default_persona on existing rows (or the whole
+# document if the stored JSON is corrupt), so it can run under executemany
+_SET_PERSONA_SQL = (
+    "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)\n"
+    "ON CONFLICT(guild_id) DO UPDATE SET data_json = CASE WHEN json_valid(data_json) "
+    "THEN json_set(data_json, '$.default_persona', json_extract(excluded.data_json, '$.default_persona')) "
+    "ELSE excluded.data_json END, updated_at = CURRENT_TIMESTAMP"
+)
+
 
 class SettingsService:
     def __init__(self, db: Database) -> None:
         self.db = db
+        # In-memory mirror of guild settings; entries are dropped on every write
+        self._cache: dict[int, dict[str, Any]] = {}
+        # Per-guild locks so concurrent cache misses collapse into one DB round-trip
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def _lock_for(self, guild_id: int) -> asyncio.Lock:
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        return lock
 
     async def get(self, guild_id: int) -> dict[str, Any]:
+        cached = self._cache.get(guild_id)
+        if cached is None:
+            async with self._lock_for(guild_id):
+                # Re-check: another coroutine may have filled the entry while we waited
+                cached = self._cache.get(guild_id)
+                if cached is None:
+                    cached = await self._load(guild_id)
+                    self._cache[guild_id] = cached
+        # Hand out a copy so callers can mutate freely without touching the cache
+        return copy.deepcopy(cached)
+
+    async def _load(self, guild_id: int) -> dict[str, Any]:
         # Use INSERT OR IGNORE to atomically create default settings if they don't exist
         # This prevents race conditions when multiple requests check simultaneously
         await self.db.execute(
@@ -49,11 +82,13 @@ class SettingsService:
 
     async def set(self, guild_id: int, data: dict[str, Any]) -> None:
         payload = json.dumps(data)
-        await self.db.execute(
-            "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)\n"
-            "ON CONFLICT(guild_id) DO UPDATE SET data_json = excluded.data_json, updated_at = CURRENT_TIMESTAMP",
-            (str(guild_id), payload),
-        )
+        async with self._lock_for(guild_id):
+            await self.db.execute(
+                "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)\n"
+                "ON CONFLICT(guild_id) DO UPDATE SET data_json = excluded.data_json, updated_at = CURRENT_TIMESTAMP",
+                (str(guild_id), payload),
+            )
+            self._cache.pop(guild_id, None)
 
     async def set_persona(self, guild_id: int, scope: str, target_id: int | None, persona_name: str) -> None:
         # Scope simplified: always set guild-wide persona
@@ -61,6 +96,30 @@ class SettingsService:
         data["default_persona"] = persona_name
         await self.set(guild_id, data)
 
+    async def set_personas_bulk(self, personas: Iterable[tuple[int, str]]) -> None:
+        """Set the guild-wide persona for many guilds in one executemany batch.
+
+        Args:
+            personas: (guild_id, persona_name) tuples
+        """
+        personas = list(personas)
+        if not personas:
+            return
+        guild_ids = sorted({guild_id for guild_id, _ in personas})
+        async with contextlib.AsyncExitStack() as stack:
+            # Sorted acquisition keeps bulk writers from deadlocking each other
+            for guild_id in guild_ids:
+                await stack.enter_async_context(self._lock_for(guild_id))
+            await self.db.executemany(
+                _SET_PERSONA_SQL,
+                (
+                    (str(guild_id), json.dumps({**DEFAULT_SETTINGS, "default_persona": name}))
+                    for guild_id, name in personas
+                ),
+            )
+            for guild_id in guild_ids:
+                self._cache.pop(guild_id, None)
+
     async def resolve_persona_name(self, guild_id: int, channel_id: int, user_id: int) -> str:
         # All personas are guild-wide; ignore channel/user.
         data = await self.get(guild_id)
@@ -1,25 +1,140 @@
 from __future__ import annotations
 
+import asyncio
 import copy
 import json
 import logging
-from typing import Any
+import sys
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Iterable
 
 from .db import Database
 
+try:
+    import orjson as _orjson  # type: ignore
+except ImportError:  # optional speedup; stdlib json is used otherwise
+    _orjson = None
+
 
 log = logging.getLogger(__name__)
 
 
-DEFAULT_USER_PREFERENCES: dict[str, Any] = {
+def _json_loads(raw: str | bytes) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type
+    if _orjson is not None:
+        return _orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _json_dumps(obj: Any) -> str:
+    # SQLite stores text, so decode orjson's bytes output
+    if _orjson is not None:
+        return _orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+# Read-only so callers cannot mutate the shared defaults; use dict(...) for a copy
+DEFAULT_USER_PREFERENCES: MappingProxyType[str, Any] = MappingProxyType({
     "response_length": "balanced",
     "emoji_density": "normal",
     "preferred_persona": None,
+})
+
+# Prebuilt forms of the defaults for the hot paths in the service
+_DEFAULTS_ITEMS = tuple(DEFAULT_USER_PREFERENCES.items())
+_DEFAULTS_JSON = _json_dumps(dict(_DEFAULTS_ITEMS))
+
+# Reuse from settings.py for consistency. Interned so values loaded from the
+# database (see _load) are the very same objects used as lookup keys elsewhere.
+# The *_ORDER tuples give the display order (messages, autocomplete).
+VALID_RESPONSE_LENGTHS_ORDER = tuple(sys.intern(s) for s in ("concise", "balanced", "detailed"))
+VALID_EMOJI_DENSITIES_ORDER = tuple(sys.intern(s) for s in ("none", "minimal", "normal", "lots"))
+
+# Membership checks are O(1) hash lookups
+VALID_RESPONSE_LENGTHS: frozenset[str] = frozenset(VALID_RESPONSE_LENGTHS_ORDER)
+VALID_EMOJI_DENSITIES: frozenset[str] = frozenset(VALID_EMOJI_DENSITIES_ORDER)
+
+# Keys computed by get() from the stored preferences; never persisted
+_DERIVED_KEYS = frozenset({"emoji_enforcement_enabled"})
+
+# Keys whose stored values come from the fixed vocabularies above
+_INTERNED_KEYS = ("response_length", "emoji_density")
+
+# (value, lowercased value) pairs computed once so autocomplete never re-lowers options
+VALID_RESPONSE_LENGTHS_LC = tuple((v, v.lower()) for v in VALID_RESPONSE_LENGTHS_ORDER)
+VALID_EMOJI_DENSITIES_LC = tuple((v, v.lower()) for v in VALID_EMOJI_DENSITIES_ORDER)
+
+# Maximum number of users whose preferences are mirrored in memory
+_CACHE_MAX_USERS = 1024
+
+# Whole-document upsert used by set()
+_UPSERT_SQL = (
+    "INSERT INTO user_preferences (user_id, data_json) VALUES (?, ?)\n"
+    "ON CONFLICT(user_id) DO UPDATE SET data_json = excluded.data_json, updated_at = CURRENT_TIMESTAMP"
+)
+
+
+def _set_fields_sql(keys: tuple[str, ...]) -> str:
+    # New users get the full defaults document; existing rows patch the given keys
+    # in place (falling back to the new document if the stored JSON is corrupt).
+    patches = ", ".join(f"'$.{k}', json_extract(excluded.data_json, '$.{k}')" for k in keys)
+    return (
+        "INSERT INTO user_preferences (user_id, data_json) VALUES (?, ?)\n"
+        "ON CONFLICT(user_id) DO UPDATE SET data_json = CASE WHEN json_valid(data_json) "
+        f"THEN json_set(data_json, {patches}) "
+        "ELSE excluded.data_json END, updated_at = CURRENT_TIMESTAMP"
+    )
+
+
+# Upserts keyed by the sorted preference names they patch. Single-key statements
+# are built at import time; other combinations on first use by set_many().
+_SET_FIELDS_SQL: dict[tuple[str, ...], str] = {
+    (key,): _set_fields_sql((key,)) for key in DEFAULT_USER_PREFERENCES
+}
+
+
+def _fields_sql(keys: tuple[str, ...]) -> str:
+    sql = _SET_FIELDS_SQL.get(keys)
+    if sql is None:
+        sql = _SET_FIELDS_SQL[keys] = _set_fields_sql(keys)
+    return sql
+
+
+def _validate_field(key: str, value: Any) -> None:
+    """Raise ValueError if ``value`` is not allowed for preference ``key``."""
+    if key == "response_length" and value not in VALID_RESPONSE_LENGTHS:
+        raise ValueError(
+            f"Invalid response length '{value}'. Must be one of: {', '.join(VALID_RESPONSE_LENGTHS_ORDER)}"
+        )
+    if key == "emoji_density" and value not in VALID_EMOJI_DENSITIES:
+        raise ValueError(
+            f"Invalid emoji density '{value}'. Must be one of: {', '.join(VALID_EMOJI_DENSITIES_ORDER)}"
+        )
+
+
+_AUTOCOMPLETE_VALUES: dict[str, tuple[tuple[str, str], ...]] = {
+    "response_length": VALID_RESPONSE_LENGTHS_LC,
+    "emoji_density": VALID_EMOJI_DENSITIES_LC,
 }
 
-# Reuse from settings.py for consistency
-VALID_RESPONSE_LENGTHS = ("concise", "balanced", "detailed")
-VALID_EMOJI_DENSITIES = ("none", "minimal", "normal", "lots")
+
+def autocomplete_values(preference: str, query: str) -> list[str]:
+    """Return the fixed-vocabulary values for a preference matching a query.
+
+    Args:
+        preference: Preference name ("response_length" or "emoji_density")
+        query: Text typed so far; matched case-insensitively as a substring
+
+    Returns:
+        Matching values in their canonical order, or an empty list for
+        preferences without a fixed vocabulary
+    """
+    pairs = _AUTOCOMPLETE_VALUES.get(preference, ())
+    query = query.lower()
+    if not query:
+        return [v for v, _ in pairs]
+    return [v for v, lc in pairs if query in lc]
 
 
 class UserPreferencesService:
@@ -31,49 +146,95 @@ class UserPreferencesService:
 
     def __init__(self, db: Database) -> None:
         self.db = db
+        # LRU mirror of stored preferences; entries are dropped on every write
+        self._cache: OrderedDict[int, dict[str, Any]] = OrderedDict()
+        # Bumped on every invalidation so an in-flight read never caches stale data
+        self._generation = 0
+        # Pending cache-miss loads; concurrent gets for the same user await one query
+        self._inflight: dict[int, asyncio.Task[dict[str, Any]]] = {}
 
     async def get(self, user_id: int) -> dict[str, Any]:
         """Get user preferences, creating defaults if not exists.
 
-        Uses INSERT OR IGNORE to atomically create default preferences if they
-        don't exist. This prevents race conditions when multiple requests check
-        simultaneously.
+        Results are served from an in-memory LRU cache when possible; writes
+        through this service invalidate the user's entry.
 
         Args:
             user_id: Discord user snowflake ID
 
         Returns:
-            User preferences dictionary with all keys populated
+            User preferences dictionary with all keys populated, plus the
+            derived ``emoji_enforcement_enabled`` flag (False when
+            emoji_density is "none")
         """
-        # Use INSERT OR IGNORE to atomically create default preferences if they don't exist
-        # This prevents race conditions when multiple requests check simultaneously
-        await self.db.execute(
-            "INSERT OR IGNORE INTO user_preferences (user_id, data_json) VALUES (?, ?)",
-            (str(user_id), json.dumps(DEFAULT_USER_PREFERENCES)),
-        )
+        cached = self._cache.get(user_id)
+        if cached is not None:
+            self._cache.move_to_end(user_id)
+            return cached.copy()
+
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load_and_cache(user_id))
+            self._inflight[user_id] = task
+        # Shielded so one caller being cancelled doesn't cancel the shared load
+        return (await asyncio.shield(task)).copy()
+
+    async def _load_and_cache(self, user_id: int) -> dict[str, Any]:
+        """Run one shared cache-miss load and cache it if no write raced it."""
+        generation = self._generation
+        try:
+            data = await self._load(user_id)
+        finally:
+            # A write may have detached this load and a newer one taken its slot
+            if self._inflight.get(user_id) is asyncio.current_task():
+                del self._inflight[user_id]
+
+        if generation == self._generation:
+            self._cache[user_id] = data
+            if len(self._cache) > _CACHE_MAX_USERS:
+                self._cache.popitem(last=False)
+        return data
+
+    def _invalidate(self, user_id: int) -> None:
+        self._generation += 1
+        self._cache.pop(user_id, None)
+        # Gets issued after the write must start a fresh load, not join this one
+        self._inflight.pop(user_id, None)
+
+    async def _load(self, user_id: int) -> dict[str, Any]:
+        """Read preferences from the database, creating the default row if needed.
 
-        # Now fetch (guaranteed to exist)
+        The whole preferences document lives in one JSON column, so an existing
+        user costs a single SELECT. New users fall through to INSERT OR IGNORE,
+        which atomically creates the default row even if several requests race.
+        """
         row = await self.db.fetchone(
             "SELECT data_json FROM user_preferences WHERE user_id = ?", (str(user_id),)
         )
         if not row:
-            # Should never happen after INSERT OR IGNORE, but handle defensively
-            log.warning(
-                "User preferences row missing after INSERT OR IGNORE for user %s",
-                user_id,
+            # A concurrent set() through this service bumps the generation, so
+            # these defaults are never cached over a newer write
+            await self.db.execute(
+                "INSERT OR IGNORE INTO user_preferences (user_id, data_json) VALUES (?, ?)",
+                (str(user_id), _DEFAULTS_JSON),
             )
-            return DEFAULT_USER_PREFERENCES.copy()
+            row = (_DEFAULTS_JSON,)
 
         try:
-            data = json.loads(row[0])
+            data = _json_loads(row[0])
         except (json.JSONDecodeError, TypeError, ValueError) as e:
             log.warning("Failed to parse user preferences JSON for user %s: %s", user_id, e)
-            data = DEFAULT_USER_PREFERENCES.copy()
+            data = dict(_DEFAULTS_ITEMS)
 
         # Ensure keys exist with proper deep copy for mutable defaults
-        for k, v in DEFAULT_USER_PREFERENCES.items():
+        for k, v in _DEFAULTS_ITEMS:
             if k not in data:
                 data[k] = copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+        for k in _INTERNED_KEYS:
+            if isinstance(data[k], str):
+                data[k] = sys.intern(data[k])
+        # Precomputed so the message handler checks one flag instead of comparing strings
+        data["emoji_enforcement_enabled"] = data["emoji_density"] != "none"
         return data
 
     async def set(self, user_id: int, data: dict[str, Any]) -> None:
@@ -83,14 +244,30 @@ class UserPreferencesService:
 
         Args:
             user_id: Discord user snowflake ID
-            data: Preferences dictionary to store
+            data: Preferences dictionary to store (derived keys from get() are dropped)
         """
-        payload = json.dumps(data)
-        await self.db.execute(
-            "INSERT INTO user_preferences (user_id, data_json) VALUES (?, ?)\n"
-            "ON CONFLICT(user_id) DO UPDATE SET data_json = excluded.data_json, updated_at = CURRENT_TIMESTAMP",
-            (str(user_id), payload),
+        payload = _json_dumps({k: v for k, v in data.items() if k not in _DERIVED_KEYS})
+        await self.db.execute(_UPSERT_SQL, (str(user_id), payload))
+        self._invalidate(user_id)
+
+    async def _write_fields(self, user_id: int, values: dict[str, Any]) -> None:
+        """Atomically patch validated preference keys with one upsert statement.
+
+        The stored document is patched in SQL (json_set), so there is no
+        read-modify-write round trip through Python.
+        """
+        payload = _json_dumps({**DEFAULT_USER_PREFERENCES, **values})
+        await self.db.execute(_fields_sql(tuple(sorted(values))), (str(user_id), payload))
+        self._invalidate(user_id)
+
+    async def _set_field_many(self, key: str, pairs: list[tuple[int, Any]]) -> None:
+        """Set one preference key for many users with a single executemany batch."""
+        await self.db.executemany(
+            _fields_sql((key,)),
+            ((str(uid), _json_dumps({**DEFAULT_USER_PREFERENCES, key: value})) for uid, value in pairs),
         )
+        for uid, _ in pairs:
+            self._invalidate(uid)
 
     async def set_response_length(self, user_id: int, length: str) -> None:
         """Set the response length preference for a user.
@@ -102,13 +279,8 @@ class UserPreferencesService:
         Raises:
             ValueError: If length is not a valid option
         """
-        if length not in VALID_RESPONSE_LENGTHS:
-            raise ValueError(
-                f"Invalid response length '{length}'. Must be one of: {', '.join(VALID_RESPONSE_LENGTHS)}"
-            )
-        data = await self.get(user_id)
-        data["response_length"] = length
-        await self.set(user_id, data)
+        _validate_field("response_length", length)
+        await self._write_fields(user_id, {"response_length": length})
 
     async def set_emoji_density(self, user_id: int, density: str) -> None:
         """Set the emoji density preference for a user.
@@ -120,13 +292,57 @@ class UserPreferencesService:
         Raises:
             ValueError: If density is not a valid option
         """
-        if density not in VALID_EMOJI_DENSITIES:
-            raise ValueError(
-                f"Invalid emoji density '{density}'. Must be one of: {', '.join(VALID_EMOJI_DENSITIES)}"
-            )
-        data = await self.get(user_id)
-        data["emoji_density"] = density
-        await self.set(user_id, data)
+        _validate_field("emoji_density", density)
+        await self._write_fields(user_id, {"emoji_density": density})
+
+    async def set_response_length_many(self, pairs: Iterable[tuple[int, str]]) -> None:
+        """Set the response length preference for many users at once.
+
+        Args:
+            pairs: (user_id, length) tuples; every length must be valid
+
+        Raises:
+            ValueError: If any length is not a valid option (nothing is written)
+        """
+        pairs = list(pairs)
+        for _, length in pairs:
+            _validate_field("response_length", length)
+        await self._set_field_many("response_length", pairs)
+
+    async def set_emoji_density_many(self, pairs: Iterable[tuple[int, str]]) -> None:
+        """Set the emoji density preference for many users at once.
+
+        Args:
+            pairs: (user_id, density) tuples; every density must be valid
+
+        Raises:
+            ValueError: If any density is not a valid option (nothing is written)
+        """
+        pairs = list(pairs)
+        for _, density in pairs:
+            _validate_field("emoji_density", density)
+        await self._set_field_many("emoji_density", pairs)
+
+    async def set_many(self, user_id: int, **values: Any) -> None:
+        """Set several preferences for a user with one upsert statement.
+
+        Keys not passed keep their stored values.
+
+        Args:
+            user_id: Discord user snowflake ID
+            **values: Preference names mapped to new values
+
+        Raises:
+            ValueError: If a name is unknown or a value is not a valid option
+                (nothing is written)
+        """
+        if not values:
+            return
+        for key, value in values.items():
+            if key not in DEFAULT_USER_PREFERENCES:
+                raise ValueError(f"Unknown preference '{key}'")
+            _validate_field(key, value)
+        await self._write_fields(user_id, values)
 
     async def set_preferred_persona(self, user_id: int, persona_name: str | None) -> None:
         """Set the preferred persona for a user.
@@ -135,9 +351,7 @@ class UserPreferencesService:
             user_id: Discord user snowflake ID
             persona_name: Name of the persona, or None to clear preference
         """
-        data = await self.get(user_id)
-        data["preferred_persona"] = persona_name
-        await self.set(user_id, data)
+        await self._write_fields(user_id, {"preferred_persona": persona_name})
 
     async def resolve_response_length(self, user_id: int) -> str:
         """Resolve the response length preference for a user.
@@ -187,3 +401,4 @@ class UserPreferencesService:
             "DELETE FROM user_preferences WHERE user_id = ?",
             (str(user_id),),
         )
+        self._invalidate(user_id)
@@ -10,7 +10,8 @@ import aiosqlite
 log = logging.getLogger(__name__)
 
 
-# Migration functions take a connection and perform schema changes
+# Migration functions take a connection and perform schema changes; they run
+# inside a transaction opened by apply_migrations and must not commit
 Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
 
 
@@ -34,7 +35,6 @@ async def _migration_v2_add_messages_role_idx(conn: aiosqlite.Connection) -> Non
         CREATE INDEX IF NOT EXISTS messages_role_id_idx
         ON messages(guild_id, channel_id, role, id DESC)
     """)
-    await conn.commit()
 
 
 async def _migration_v3_create_user_preferences(conn: aiosqlite.Connection) -> None:
@@ -50,7 +50,6 @@ async def _migration_v3_create_user_preferences(conn: aiosqlite.Connection) -> N
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    await conn.commit()
 
 
 MIGRATIONS: list[Migration] = [
@@ -127,10 +126,14 @@ async def apply_migrations(conn: aiosqlite.Connection, target_version: int | Non
         log.info("Applying migration v%d...", version)
 
         try:
+            # Schema change and version bump commit together (one fsync), so a
+            # failed migration leaves the database at the previous version
+            await conn.execute("BEGIN")
             await migration(conn)
             await set_schema_version(conn, version)
             log.info("Migration v%d applied successfully", version)
         except Exception as e:
+            await conn.rollback()
             log.error("Migration v%d failed: %s", version, e, exc_info=True)
             raise
 
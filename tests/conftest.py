@@ -1,9 +1,41 @@
 """Pytest configuration and shared fixtures."""
 import os
+import sys
 import tempfile
 from typing import AsyncGenerator
+from unittest.mock import MagicMock
 
 import pytest
+import pytest_asyncio
+
+from prism.services import db as db_module
+from tests import sync_sqlite
+
+# The real aiosqlite connector, kept so fixtures can restore it under TEST_DB_SYNC
+_aiosqlite_connect = db_module._connect
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _sync_sqlite_backend():
+    """Run every Database on the inline sqlite3 shim when TEST_DB_SYNC=1 (opt-in)."""
+    if os.getenv("TEST_DB_SYNC", "").lower() not in {"1", "true", "yes", "on"}:
+        yield
+        return
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db_module, "_connect", sync_sqlite.connect)
+        yield
+
+
+@pytest.fixture
+def sync_sqlite_backend(monkeypatch):
+    """Route this test's Database connections through the inline sqlite3 shim."""
+    monkeypatch.setattr(db_module, "_connect", sync_sqlite.connect)
+
+
+@pytest.fixture
+def aiosqlite_backend(monkeypatch):
+    """Route this test's Database connections through aiosqlite, even under TEST_DB_SYNC."""
+    monkeypatch.setattr(db_module, "_connect", _aiosqlite_connect)
 
 
 @pytest.fixture
@@ -24,14 +56,77 @@ async def temp_db() -> AsyncGenerator[str, None]:
             pass
 
 
-@pytest.fixture
-async def db_with_schema(temp_db: str):
-    """Create a database with the schema applied."""
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def _schema_db(_sync_sqlite_backend):
+    """Build the in-memory schema (tables + migrations) once per session.
+
+    Tests never touch this database directly; db_with_schema hands out copies.
+    ``:memory:`` databases are private to the process, so each pytest-xdist
+    worker automatically gets its own template.
+    """
     from prism.services.db import Database
-    
-    db = await Database.init(temp_db)
+
+    db = await Database.init(":memory:")
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@pytest.fixture
+async def db_with_schema(_schema_db):
+    """Provide a fresh in-memory database copied from the session template.
+
+    The schema and migrations are applied once per session; each test gets
+    a page-level backup of that template instead of a CREATE TABLE/migration
+    run, so no state leaks between tests.
+    """
+    db = await _schema_db.copy()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@pytest.fixture
+async def aiosqlite_db(aiosqlite_backend):
+    """Provide an in-memory database on the real aiosqlite backend.
+
+    For tests that depend on DB calls suspending (coalescing, locking, races);
+    ignores TEST_DB_SYNC so they keep exercising real interleaving.
+    """
+    db = await db_module.Database.init(":memory:")
     try:
         yield db
     finally:
         await db.close()
 
+
+@pytest.fixture
+def user_prefs(db_with_schema):
+    """UserPreferencesService bound to the test's database."""
+    from prism.services.user_preferences import UserPreferencesService
+
+    return UserPreferencesService(db=db_with_schema)
+
+
+@pytest.fixture
+def guild_settings(db_with_schema):
+    """SettingsService bound to the test's database."""
+    from prism.services.settings import SettingsService
+
+    return SettingsService(db=db_with_schema)
+
+
+@pytest.fixture(scope="session")
+def stub_cog_modules() -> dict[str, MagicMock]:
+    """Install stub modules for the cogs amain() loads, once per session.
+
+    The stubs are intentionally left in place: no other tests import these
+    cogs, and it avoids patch.dict copying all of sys.modules for every test.
+    """
+    stubs: dict[str, MagicMock] = {}
+    for name in ("personas", "memory", "preferences"):
+        stubs[name] = MagicMock(setup=MagicMock())
+        sys.modules[f"prism.cogs.{name}"] = stubs[name]
+    return stubs
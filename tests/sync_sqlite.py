@@ -0,0 +1,91 @@
+"""Inline sqlite3 stand-in for aiosqlite, used when TEST_DB_SYNC is set.
+
+aiosqlite runs every call on a worker thread; for in-memory test databases
+that hop dominates latency. These classes keep the async interface Database
+uses but run each call directly. Nothing here ever suspends, so tests that
+depend on real interleaving use the aiosqlite_db fixture instead.
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Iterable
+
+from prism.services import db as db_module
+
+
+class SyncCursor:
+    """Async facade over a sqlite3 cursor (fetch calls run inline)."""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = cursor
+
+    async def fetchone(self) -> Any:
+        return self._cursor.fetchone()
+
+    async def fetchall(self) -> list[Any]:
+        return self._cursor.fetchall()
+
+    async def close(self) -> None:
+        self._cursor.close()
+
+
+class SyncResult:
+    """Mirror aiosqlite's execute() result: awaitable and an async context manager."""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = SyncCursor(cursor)
+
+    def __await__(self):
+        return self._resolve().__await__()
+
+    async def _resolve(self) -> SyncCursor:
+        return self._cursor
+
+    async def __aenter__(self) -> SyncCursor:
+        return self._cursor
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self._cursor.close()
+
+
+class SyncConnection:
+    """Minimal aiosqlite.Connection stand-in backed by a plain sqlite3 connection."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self._conn = conn
+
+    @property
+    def row_factory(self) -> Any:
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory: Any) -> None:
+        self._conn.row_factory = factory
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> SyncResult:
+        return SyncResult(self._conn.execute(sql, tuple(params)))
+
+    async def executemany(self, sql: str, params: Iterable[Iterable[Any]]) -> SyncCursor:
+        return SyncCursor(self._conn.executemany(sql, params))
+
+    async def backup(self, target: SyncConnection) -> None:
+        self._conn.backup(target._conn)
+
+    async def executescript(self, script: str) -> SyncCursor:
+        return SyncCursor(self._conn.executescript(script))
+
+    async def commit(self) -> None:
+        self._conn.commit()
+
+    async def rollback(self) -> None:
+        self._conn.rollback()
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+async def connect(path: str) -> SyncConnection:
+    """Drop-in replacement for prism.services.db._connect."""
+    return SyncConnection(
+        sqlite3.connect(path, check_same_thread=False, cached_statements=db_module._CACHED_STATEMENTS)
+    )
@@ -1,6 +1,12 @@
 """Tests for database service."""
+import sqlite3
+from unittest.mock import patch
+
+import aiosqlite
 import pytest
+from prism.services import db as db_module
 from prism.services.db import Database
+from tests.sync_sqlite import SyncConnection
 
 
 @pytest.mark.asyncio
@@ -12,6 +18,32 @@ async def test_database_init(temp_db):
     await db.close()
 
 
+@pytest.mark.asyncio
+async def test_database_runs_on_sync_sqlite_shim(sync_sqlite_backend):
+    """Test the TEST_DB_SYNC shim stands in for aiosqlite under Database."""
+    db = await Database.init(":memory:")
+    try:
+        assert isinstance(db.conn, SyncConnection)
+        await db.execute("INSERT INTO settings (guild_id, data_json) VALUES (?, ?)", ("1", "{}"))
+        row = await db.fetchone("SELECT data_json FROM settings WHERE guild_id = ?", ("1",))
+        assert row["data_json"] == "{}"
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_database_init_uses_aiosqlite(temp_db, aiosqlite_backend):
+    """Test the production path goes through aiosqlite."""
+    db = await Database.init(temp_db)
+    try:
+        assert isinstance(db.conn, aiosqlite.Connection)
+        await db.execute("INSERT INTO settings (guild_id, data_json) VALUES (?, ?)", ("1", "{}"))
+        rows = await db.fetchall("SELECT guild_id FROM settings")
+        assert [r[0] for r in rows] == ["1"]
+    finally:
+        await db.close()
+
+
 @pytest.mark.asyncio
 async def test_database_execute_and_fetch(db_with_schema):
     """Test basic execute and fetch operations."""
@@ -66,3 +98,68 @@ async def test_database_schema_tables_exist(db_with_schema):
     assert "messages" in table_names
     assert "emoji_index" in table_names
 
+
+@pytest.mark.asyncio
+async def test_database_executemany_rolls_back_failed_batch(db_with_schema):
+    """Test a row failing mid-batch discards the earlier rows instead of leaving them pending."""
+    with pytest.raises(sqlite3.IntegrityError):
+        await db_with_schema.executemany(
+            "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)",
+            [("1", "{}"), ("2", None)],
+        )
+
+    # An unrelated write commits on the same connection; row "1" must not ride along
+    await db_with_schema.execute(
+        "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)", ("3", "{}")
+    )
+
+    rows = await db_with_schema.fetchall("SELECT guild_id FROM settings ORDER BY guild_id")
+    assert [r["guild_id"] for r in rows] == ["3"]
+
+
+@pytest.mark.asyncio
+async def test_database_copy_is_independent(db_with_schema):
+    """Test copy() carries schema and data over without sharing later writes."""
+    await db_with_schema.execute(
+        "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)", ("111", "{}")
+    )
+
+    clone = await db_with_schema.copy()
+    try:
+        await clone.execute(
+            "INSERT INTO settings (guild_id, data_json) VALUES (?, ?)", ("222", "{}")
+        )
+        clone_rows = await clone.fetchall("SELECT guild_id FROM settings ORDER BY guild_id")
+        source_rows = await db_with_schema.fetchall("SELECT guild_id FROM settings")
+    finally:
+        await clone.close()
+
+    assert [r["guild_id"] for r in clone_rows] == ["111", "222"]
+    assert [r["guild_id"] for r in source_rows] == ["111"]
+
+
+@pytest.mark.asyncio
+async def test_database_connects_with_statement_cache(aiosqlite_backend):
+    """Test connections are opened with the enlarged prepared-statement cache."""
+    with patch.object(db_module.aiosqlite, "connect", wraps=aiosqlite.connect) as spy:
+        db = await Database.init(":memory:")
+    await db.close()
+
+    assert spy.call_args.kwargs["cached_statements"] == db_module._CACHED_STATEMENTS
+
+
+@pytest.mark.asyncio
+async def test_database_copy_applies_connection_pragmas(db_with_schema):
+    """Test copy() re-applies the per-connection PRAGMAs Database.init sets."""
+    clone = await db_with_schema.copy()
+    try:
+        synchronous = await clone.fetchone("PRAGMA synchronous")
+        temp_store = await clone.fetchone("PRAGMA temp_store")
+        foreign_keys = await clone.fetchone("PRAGMA foreign_keys")
+    finally:
+        await clone.close()
+
+    # NORMAL == 1, MEMORY == 2
+    assert synchronous[0] == 1
+    assert temp_store[0] == 2
+    assert foreign_keys[0] == 1
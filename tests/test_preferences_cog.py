@@ -187,22 +187,20 @@ class TestPreferencesReset:
         await user_prefs.set_emoji_density(user_id, "none")
         await user_prefs.set_preferred_persona(user_id, "formal")
 
-        # Verify preferences are set
-        assert await user_prefs.resolve_response_length(user_id) == "detailed"
-        assert await user_prefs.resolve_emoji_density(user_id) == "none"
-        assert await user_prefs.resolve_preferred_persona(user_id) == "formal"
+        # Verify preferences are set (single read, as the view command does)
+        prefs = await user_prefs.get(user_id)
+        assert prefs["response_length"] == "detailed"
+        assert prefs["emoji_density"] == "none"
+        assert prefs["preferred_persona"] == "formal"
 
         # Execute reset (what the command does)
         await user_prefs.reset(user_id)
 
         # Verify preferences are reset to defaults
-        length = await user_prefs.resolve_response_length(user_id)
-        density = await user_prefs.resolve_emoji_density(user_id)
-        persona = await user_prefs.resolve_preferred_persona(user_id)
-
-        assert length == "balanced"
-        assert density == "normal"
-        assert persona is None
+        prefs = await user_prefs.get(user_id)
+        assert prefs["response_length"] == "balanced"
+        assert prefs["emoji_density"] == "normal"
+        assert prefs["preferred_persona"] is None
 
 
 class TestPreferencesAutocomplete:
@@ -229,46 +227,33 @@ class TestPreferencesAutocomplete:
     @pytest.mark.asyncio
     async def test_preference_value_autocomplete_returns_response_length_options(self):
         """Test autocomplete returns correct options for response_length values."""
-        from prism.services.user_preferences import VALID_RESPONSE_LENGTHS
-
-        # Simulate the autocomplete logic for response_length
-        preference = "response_length"
-        query = ""
+        from prism.services.user_preferences import autocomplete_values
 
-        if preference == "response_length":
-            options = list(VALID_RESPONSE_LENGTHS)
-        else:
-            options = []
-
-        # Filter by query
-        if query:
-            options = [opt for opt in options if query in opt.lower()]
+        # Same helper the cog's value autocomplete delegates to
+        options = autocomplete_values("response_length", "")
 
         # Verify response_length options
         assert "concise" in options
         assert "balanced" in options
         assert "detailed" in options
 
+        # Query filters case-insensitively
+        assert autocomplete_values("response_length", "CON") == ["concise"]
+
     @pytest.mark.asyncio
     async def test_preference_value_autocomplete_returns_emoji_density_options(self):
         """Test autocomplete returns correct options for emoji_density values."""
-        from prism.services.user_preferences import VALID_EMOJI_DENSITIES
-
-        # Simulate the autocomplete logic for emoji_density
-        preference = "emoji_density"
-        query = ""
-
-        if preference == "emoji_density":
-            options = list(VALID_EMOJI_DENSITIES)
-        else:
-            options = []
+        from prism.services.user_preferences import autocomplete_values
 
-        # Filter by query
-        if query:
-            options = [opt for opt in options if query in opt.lower()]
+        # Same helper the cog's value autocomplete delegates to
+        options = autocomplete_values("emoji_density", "")
 
         # Verify emoji_density options
         assert "none" in options
         assert "minimal" in options
         assert "normal" in options
         assert "lots" in options
+
+        # Query filters by substring; unknown preferences have no fixed values
+        assert autocomplete_values("emoji_density", "n") == ["none", "minimal", "normal"]
+        assert autocomplete_values("preferred_persona", "") == []
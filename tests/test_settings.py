@@ -1,4 +1,6 @@
 """Tests for settings service."""
+from unittest.mock import patch
+
 import pytest
 
 from prism.services.settings import DEFAULT_SETTINGS, SettingsService
@@ -193,16 +195,29 @@ class TestSettingsService:
         assert name1 == "persona-a"
         assert name2 == "persona-b"
 
+    @pytest.mark.asyncio
+    async def test_set_personas_bulk(self, db_with_schema):
+        """Test set_personas_bulk sets many guilds and preserves other settings."""
+        service = SettingsService(db=db_with_schema)
+        await service.set(111, {"default_persona": "original", "extra": "preserved"})
+        await service.get(111)  # cached
+
+        await service.set_personas_bulk([(111, "persona-a"), (222, "persona-b")])
+
+        assert await service.resolve_persona_name(111, 0, 0) == "persona-a"
+        assert await service.resolve_persona_name(222, 0, 0) == "persona-b"
+        assert (await service.get(111))["extra"] == "preserved"
+
 
 class TestSettingsServiceConcurrency:
     """Tests for concurrent access scenarios."""
 
     @pytest.mark.asyncio
-    async def test_concurrent_get_same_guild(self, db_with_schema):
+    async def test_concurrent_get_same_guild(self, aiosqlite_db):
         """Test concurrent get calls for same guild."""
         import asyncio
 
-        service = SettingsService(db=db_with_schema)
+        service = SettingsService(db=aiosqlite_db)
 
         # Simulate concurrent access
         results = await asyncio.gather(
@@ -215,6 +230,35 @@ class TestSettingsServiceConcurrency:
         for settings in results:
             assert settings["default_persona"] == "default"
 
+    @pytest.mark.asyncio
+    async def test_concurrent_get_single_db_round_trip(self, aiosqlite_db):
+        """Test concurrent get calls for same guild collapse into one DB read."""
+        import asyncio
+
+        service = SettingsService(db=aiosqlite_db)
+
+        with patch.object(aiosqlite_db, "execute", wraps=aiosqlite_db.execute) as spy:
+            await asyncio.gather(
+                service.get(123456),
+                service.get(123456),
+                service.get(123456),
+            )
+
+        assert spy.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_set_invalidates_cached_settings(self, db_with_schema):
+        """Test set drops the cached entry so the next get sees the write."""
+        service = SettingsService(db=db_with_schema)
+
+        first = await service.get(123456)
+        first["default_persona"] = "mutated-locally"
+        assert (await service.get(123456))["default_persona"] == "default"
+
+        await service.set_persona(123456, "guild", None, "custom")
+
+        assert (await service.get(123456))["default_persona"] == "custom"
+
     @pytest.mark.asyncio
     async def test_get_uses_insert_or_ignore(self, db_with_schema):
         """Test get uses INSERT OR IGNORE for race condition safety."""
@@ -224,9 +268,9 @@ class TestSettingsServiceConcurrency:
         await service.get(123456)
         await service.get(123456)
 
-        # Verify only one row exists
+        # Verify only one row exists (LIMIT 2 is enough to detect a duplicate)
         rows = await db_with_schema.fetchall(
-            "SELECT COUNT(*) FROM settings WHERE guild_id = ?",
+            "SELECT 1 FROM settings WHERE guild_id = ? LIMIT 2",
             ("123456",),
         )
-        assert rows[0][0] == 1
+        assert len(rows) == 1
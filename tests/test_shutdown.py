@@ -1,179 +1,199 @@
 """Tests for shutdown cleanup behavior."""
 import asyncio
+import contextlib
+from types import SimpleNamespace
+
+import aiohttp
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from prism.main import amain
-
-
-@pytest.mark.asyncio
-async def test_shutdown_includes_cleanup_delay():
-    """Test that shutdown includes a delay after bot.close() for aiohttp cleanup."""
-    # Mock all the dependencies
-    mock_setup_personas = MagicMock()
-    mock_setup_memory = MagicMock()
-    mock_setup_preferences = MagicMock()
-
-    with patch('prism.main.load_config') as mock_load_config, \
-         patch('prism.main.setup_logging'), \
-         patch('prism.main.build_bot') as mock_build_bot, \
-         patch('prism.main.Database.init', new_callable=AsyncMock) as mock_db_init, \
-         patch('prism.main.OpenRouterClient') as mock_orc_class, \
-         patch('prism.main.register_commands'), \
-         patch('prism.main.SettingsService'), \
-         patch('prism.main.UserPreferencesService'), \
-         patch('prism.main.load_git_sync_config') as mock_git_config, \
-         patch('prism.main.PersonasService') as mock_personas_class, \
-         patch('prism.main.MemoryService'), \
-         patch('prism.main.EmojiIndexService'), \
-         patch('prism.main.ChannelLockManager'), \
-         patch.dict('sys.modules', {'prism.cogs.personas': MagicMock(setup=mock_setup_personas)}), \
-         patch.dict('sys.modules', {'prism.cogs.memory': MagicMock(setup=mock_setup_memory)}), \
-         patch.dict('sys.modules', {'prism.cogs.preferences': MagicMock(setup=mock_setup_preferences)}), \
-         patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
-
-        # Configure mocks
-        mock_config = MagicMock()
-        mock_config.log_level = 'INFO'
-        mock_config.db_path = ':memory:'
-        mock_config.openrouter_api_key = 'test-key'
-        mock_config.default_model = 'test/model'
-        mock_config.fallback_model = 'test/fallback'
-        mock_config.openrouter_site_url = None
-        mock_config.openrouter_app_name = None
-        mock_config.discord_token = 'test-token'
-        mock_load_config.return_value = mock_config
-
-        # Mock git sync config (disabled by default)
-        mock_git_sync_config = MagicMock()
-        mock_git_sync_config.enabled = False
-        mock_git_config.return_value = mock_git_sync_config
+from prism.main import _close_bot, _shutdown, amain
+
+
+# Config is read-only for amain(), so build it once for every test
+_MOCK_CONFIG = SimpleNamespace(
+    log_level='INFO',
+    db_path=':memory:',
+    openrouter_api_key='test-key',
+    default_model='test/model',
+    fallback_model='test/fallback',
+    openrouter_site_url=None,
+    openrouter_app_name=None,
+    discord_token='test-token',
+)
+
+
+@pytest.fixture(
+    params=[KeyboardInterrupt(), asyncio.CancelledError()],
+    ids=["keyboard_interrupt", "cancelled_error"],
+)
+def amain_mocks(request, stub_cog_modules):
+    """Patch amain()'s collaborators; bot.start raises the parametrized shutdown signal."""
+    with contextlib.ExitStack() as stack:
+        def p(target, **kwargs):
+            return stack.enter_context(patch(target, **kwargs))
+
+        p('prism.main.load_config', return_value=_MOCK_CONFIG)
+        p('prism.main.setup_logging')
+        p('prism.main.register_commands')
+        p('prism.main.SettingsService')
+        p('prism.main.UserPreferencesService')
+        p('prism.main.MemoryService')
+        p('prism.main.EmojiIndexService')
+        p('prism.main.ChannelLockManager')
+        # Git sync disabled
+        p('prism.main.load_git_sync_config', return_value=MagicMock(enabled=False))
 
         # Mock bot
         mock_bot = MagicMock()
         mock_bot.is_closed.return_value = False
         mock_bot.close = AsyncMock()
-        mock_bot.start = AsyncMock(side_effect=KeyboardInterrupt())  # Exit immediately
-        mock_build_bot.return_value = mock_bot
+        mock_bot.start = AsyncMock(side_effect=request.param)  # Exit immediately
+        p('prism.main.build_bot', return_value=mock_bot)
 
         # Mock database
-        mock_db = MagicMock()
-        mock_db.close = AsyncMock()
-        mock_db_init.return_value = mock_db
+        mock_db = SimpleNamespace(close=AsyncMock())
+        p('prism.main.Database.init', new_callable=AsyncMock, return_value=mock_db)
 
         # Mock OpenRouter client
-        mock_orc = MagicMock()
-        mock_orc.aclose = AsyncMock()
-        mock_orc_class.return_value = mock_orc
+        mock_orc = SimpleNamespace(aclose=AsyncMock())
+        p('prism.main.OpenRouterClient', return_value=mock_orc)
 
         # Mock PersonasService
-        mock_personas = MagicMock()
-        mock_personas.load_builtins = AsyncMock()
-        mock_personas_class.return_value = mock_personas
-
-        # Run amain and expect KeyboardInterrupt to be caught
-        try:
-            await amain()
-        except Exception:
-            pass  # Expected to exit somehow
-
-        # Verify that bot.close() was called
-        assert mock_bot.close.called
-
-        # Verify that asyncio.sleep was called after bot.close()
-        # The sleep should be called with 0.5 seconds for cleanup delay
-        sleep_calls = [call for call in mock_sleep.call_args_list if call[0][0] == 0.5]
-        assert len(sleep_calls) >= 1, "Expected asyncio.sleep(0.5) to be called for cleanup delay"
-
-
-@pytest.mark.asyncio
-async def test_aiohttp_cleanup_pattern():
-    """Test that the cleanup pattern gives aiohttp sessions time to close."""
-    # Simulate the pattern: close session, then sleep
-    mock_session = AsyncMock()
-
-    # Close and sleep like in the shutdown code
-    await mock_session.close()
-    await asyncio.sleep(0.25)
-
-    # If we got here without errors, the pattern is correct
-    assert True
-
-
-@pytest.mark.asyncio
-async def test_shutdown_cleanup_on_cancelled_error():
-    """Test that cleanup delay happens on CancelledError shutdown path."""
-    # Mock all the dependencies
-    mock_setup_personas = MagicMock()
-    mock_setup_memory = MagicMock()
-    mock_setup_preferences = MagicMock()
-
-    with patch('prism.main.load_config') as mock_load_config, \
-         patch('prism.main.setup_logging'), \
-         patch('prism.main.build_bot') as mock_build_bot, \
-         patch('prism.main.Database.init', new_callable=AsyncMock) as mock_db_init, \
-         patch('prism.main.OpenRouterClient') as mock_orc_class, \
-         patch('prism.main.register_commands'), \
-         patch('prism.main.SettingsService'), \
-         patch('prism.main.UserPreferencesService'), \
-         patch('prism.main.load_git_sync_config') as mock_git_config, \
-         patch('prism.main.PersonasService') as mock_personas_class, \
-         patch('prism.main.MemoryService'), \
-         patch('prism.main.EmojiIndexService'), \
-         patch('prism.main.ChannelLockManager'), \
-         patch.dict('sys.modules', {'prism.cogs.personas': MagicMock(setup=mock_setup_personas)}), \
-         patch.dict('sys.modules', {'prism.cogs.memory': MagicMock(setup=mock_setup_memory)}), \
-         patch.dict('sys.modules', {'prism.cogs.preferences': MagicMock(setup=mock_setup_preferences)}), \
-         patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
-
-        # Configure mocks
-        mock_config = MagicMock()
-        mock_config.log_level = 'INFO'
-        mock_config.db_path = ':memory:'
-        mock_config.openrouter_api_key = 'test-key'
-        mock_config.default_model = 'test/model'
-        mock_config.fallback_model = 'test/fallback'
-        mock_config.openrouter_site_url = None
-        mock_config.openrouter_app_name = None
-        mock_config.discord_token = 'test-token'
-        mock_load_config.return_value = mock_config
-
-        # Mock git sync config (disabled by default)
-        mock_git_sync_config = MagicMock()
-        mock_git_sync_config.enabled = False
-        mock_git_config.return_value = mock_git_sync_config
+        mock_personas = SimpleNamespace(load_builtins=AsyncMock())
+        p('prism.main.PersonasService', return_value=mock_personas)
 
-        # Mock bot
-        mock_bot = MagicMock()
-        mock_bot.is_closed.return_value = False
-        mock_bot.close = AsyncMock()
-        mock_bot.start = AsyncMock(side_effect=asyncio.CancelledError())  # Exit with CancelledError
-        mock_build_bot.return_value = mock_bot
+        mock_shutdown = p('prism.main._shutdown', new_callable=AsyncMock)
 
-        # Mock database
-        mock_db = MagicMock()
-        mock_db.close = AsyncMock()
-        mock_db_init.return_value = mock_db
+        yield SimpleNamespace(bot=mock_bot, db=mock_db, orc=mock_orc, personas=mock_personas, shutdown=mock_shutdown)
 
-        # Mock OpenRouter client
-        mock_orc = MagicMock()
-        mock_orc.aclose = AsyncMock()
-        mock_orc_class.return_value = mock_orc
 
-        # Mock PersonasService
-        mock_personas = MagicMock()
-        mock_personas.load_builtins = AsyncMock()
-        mock_personas_class.return_value = mock_personas
-
-        # Run amain and expect CancelledError to be caught
-        try:
-            await amain()
-        except Exception:
-            pass  # Expected to exit somehow
-
-        # Verify that bot.close() was called
-        assert mock_bot.close.called
-
-        # Verify that asyncio.sleep was called after bot.close()
-        # The sleep should be called with 0.5 seconds for cleanup delay
-        sleep_calls = [call for call in mock_sleep.call_args_list if call[0][0] == 0.5]
-        assert len(sleep_calls) >= 1, "Expected asyncio.sleep(0.5) to be called for cleanup delay"
+async def test_amain_shuts_down_on_signal(amain_mocks):
+    """Smoke test: amain() hands its resources to _shutdown on Ctrl-C and cancellation."""
+    # amain handles the shutdown signal itself; anything else should fail the test
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError, SystemExit):
+        await amain()
+
+    # No signal arrived, so there is no pending bot.close() task to hand over
+    amain_mocks.shutdown.assert_awaited_once_with(amain_mocks.bot, amain_mocks.orc, amain_mocks.db, None)
+
+
+def _shutdown_mocks():
+    """Bot, client and DB mocks for exercising _shutdown without amain()."""
+    bot = MagicMock()
+    bot.is_closed.return_value = False
+    bot.close = AsyncMock()
+    orc = SimpleNamespace(aclose=AsyncMock())
+    db = SimpleNamespace(close=AsyncMock())
+    return bot, orc, db
+
+
+async def test_shutdown_closes_everything():
+    """Test _shutdown closes the OpenRouter client, the bot and the database."""
+    bot, orc, db = _shutdown_mocks()
+
+    await _shutdown(bot, orc, db)
+
+    orc.aclose.assert_awaited_once()
+    bot.close.assert_awaited_once()
+    db.close.assert_awaited_once()
+
+
+async def test_shutdown_closes_bot_before_client_and_db():
+    """Test the bot is closed before the OpenRouter client and database it uses."""
+    bot, orc, db = _shutdown_mocks()
+    order = []
+    bot.close.side_effect = lambda: order.append("bot")
+    orc.aclose.side_effect = lambda: order.append("orc")
+    db.close.side_effect = lambda: order.append("db")
+
+    await _shutdown(bot, orc, db)
+
+    assert order[0] == "bot"
+    assert sorted(order[1:]) == ["db", "orc"]
+
+
+async def test_shutdown_closes_client_and_db_when_bot_close_fails():
+    """Test a failing bot close does not stop the client and database from closing."""
+    bot, orc, db = _shutdown_mocks()
+    bot.close.side_effect = RuntimeError("boom")
+
+    await _shutdown(bot, orc, db)
+
+    orc.aclose.assert_awaited_once()
+    db.close.assert_awaited_once()
+
+
+async def test_shutdown_swallows_db_close_error():
+    """Test a failing database close is logged rather than raised."""
+    bot, orc, db = _shutdown_mocks()
+    db.close.side_effect = RuntimeError("boom")
+
+    await _shutdown(bot, orc, db)
+
+    bot.close.assert_awaited_once()
+    orc.aclose.assert_awaited_once()
+
+
+async def test_shutdown_closes_db_when_client_close_fails():
+    """Test a failing OpenRouter close does not stop the database from closing."""
+    bot, orc, db = _shutdown_mocks()
+    orc.aclose.side_effect = RuntimeError("boom")
+
+    await _shutdown(bot, orc, db)
+
+    db.close.assert_awaited_once()
+
+
+async def _signal_close(session: aiohttp.ClientSession, order: list[str] | None = None) -> None:
+    """Stand-in for py-cord's bot.close() started by the signal handler.
+
+    Like Client.close(), the bot already reports closed while this is still
+    awaiting the websocket; the aiohttp session is closed a few ticks later.
+    """
+    for _ in range(5):
+        await asyncio.sleep(0)
+    await session.close()
+    if order is not None:
+        order.append("bot")
+
+
+async def test_close_bot_waits_for_pending_signal_close():
+    """Test _close_bot awaits a bot.close() the signal handler already started."""
+    session = aiohttp.ClientSession()
+    close_task = asyncio.create_task(_signal_close(session))
+
+    mock_bot = MagicMock()
+    mock_bot.is_closed.return_value = True
+    mock_bot.close = AsyncMock()
+
+    await _close_bot(mock_bot, close_task)
+
+    assert close_task.done()
+    assert session.closed
+    mock_bot.close.assert_not_awaited()
+
+
+async def test_shutdown_closes_client_and_db_after_pending_signal_close():
+    """Test the client and database close only once a pending bot close has finished."""
+    bot, orc, db = _shutdown_mocks()
+    bot.is_closed.return_value = True
+    order = []
+    orc.aclose.side_effect = lambda: order.append("orc")
+    db.close.side_effect = lambda: order.append("db")
+    close_task = asyncio.create_task(_signal_close(aiohttp.ClientSession(), order))
+
+    await _shutdown(bot, orc, db, close_task)
+
+    assert order[0] == "bot"
+    assert sorted(order[1:]) == ["db", "orc"]
+
+
+async def test_close_bot_skips_closed_bot():
+    """Test an already-closed bot is not closed twice."""
+    mock_bot = MagicMock()
+    mock_bot.is_closed.return_value = True
+    mock_bot.close = AsyncMock()
+
+    await _close_bot(mock_bot)
+
+    mock_bot.close.assert_not_awaited()
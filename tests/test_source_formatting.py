@@ -80,3 +80,15 @@ def test_format_sources_mixed_formats():
     assert "- Source 2: https://example.com/2" in result
     assert "- https://example.com/3" in result
     assert result.count("- ") == 3
+
+
+def test_format_sources_many_entries():
+    """Test formatting a large search result set keeps every valid source in order."""
+    sources = [{"url": f"https://example.com/{i}", "title": f"Source {i}"} for i in range(500)]
+    result = _format_sources(sources)
+
+    lines = result.split("\n")
+    assert lines[:3] == ["", "", "**Sources:**"]
+    assert len(lines) == 503
+    assert lines[3] == "- Source 0: https://example.com/0"
+    assert lines[-1] == "- Source 499: https://example.com/499"
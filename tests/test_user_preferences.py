@@ -1,12 +1,46 @@
 """Tests for user preferences service."""
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import aiosqlite
 import pytest
 
+from prism.main import EMOJI_DENSITY_GUIDANCE, RESPONSE_LENGTH_MAX_TOKENS
 from prism.services.user_preferences import (
     DEFAULT_USER_PREFERENCES,
     VALID_EMOJI_DENSITIES,
+    VALID_EMOJI_DENSITIES_ORDER,
     VALID_RESPONSE_LENGTHS,
+    VALID_RESPONSE_LENGTHS_ORDER,
     UserPreferencesService,
 )
+from prism.storage.migrations import (
+    apply_migrations,
+    get_schema_version,
+    init_schema_version,
+)
+
+# Simulated pre-v3 database: base tables, schema version pinned to 2, in one
+# transaction. Runs after init_schema_version(), which creates schema_version.
+BASE_V2_DDL = """
+BEGIN;
+CREATE TABLE IF NOT EXISTS settings (
+    guild_id TEXT PRIMARY KEY,
+    data_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    guild_id TEXT,
+    channel_id TEXT,
+    user_id TEXT,
+    role TEXT,
+    content TEXT
+);
+DELETE FROM schema_version;
+INSERT INTO schema_version (version) VALUES (2);
+COMMIT;
+"""
 
 
 class TestDefaultUserPreferences:
@@ -27,69 +61,68 @@ class TestDefaultUserPreferences:
         assert "preferred_persona" in DEFAULT_USER_PREFERENCES
         assert DEFAULT_USER_PREFERENCES["preferred_persona"] is None
 
+    def test_valid_value_sets_match_display_order(self):
+        """Test the frozenset vocabularies hold exactly the ordered display values."""
+        assert isinstance(VALID_RESPONSE_LENGTHS, frozenset)
+        assert isinstance(VALID_EMOJI_DENSITIES, frozenset)
+        assert VALID_RESPONSE_LENGTHS == frozenset(VALID_RESPONSE_LENGTHS_ORDER)
+        assert VALID_EMOJI_DENSITIES == frozenset(VALID_EMOJI_DENSITIES_ORDER)
+        assert VALID_RESPONSE_LENGTHS_ORDER == ("concise", "balanced", "detailed")
+        assert VALID_EMOJI_DENSITIES_ORDER == ("none", "minimal", "normal", "lots")
+
+    def test_default_user_preferences_is_read_only(self):
+        """Test DEFAULT_USER_PREFERENCES cannot be mutated by callers."""
+        with pytest.raises(TypeError):
+            DEFAULT_USER_PREFERENCES["response_length"] = "concise"  # type: ignore[index]
+
 
 class TestUserPreferencesService:
     """Tests for UserPreferencesService."""
 
-    @pytest.mark.asyncio
-    async def test_get_returns_defaults_for_new_user(self, db_with_schema):
+    async def test_get_returns_defaults_for_new_user(self, user_prefs):
         """Test get returns defaults for new user."""
-        service = UserPreferencesService(db=db_with_schema)
-
-        prefs = await service.get(123456789)
+        prefs = await user_prefs.get(123456789)
 
         assert prefs["response_length"] == "balanced"
         assert prefs["emoji_density"] == "normal"
         assert prefs["preferred_persona"] is None
 
-    @pytest.mark.asyncio
-    async def test_set_persists_preferences_correctly(self, db_with_schema):
+    async def test_set_persists_preferences_correctly(self, user_prefs):
         """Test set persists preferences correctly."""
-        service = UserPreferencesService(db=db_with_schema)
-
         custom_prefs = {
             "response_length": "concise",
             "emoji_density": "lots",
             "preferred_persona": "pirate",
         }
-        await service.set(123456789, custom_prefs)
+        await user_prefs.set(123456789, custom_prefs)
 
-        prefs = await service.get(123456789)
+        prefs = await user_prefs.get(123456789)
         assert prefs["response_length"] == "concise"
         assert prefs["emoji_density"] == "lots"
         assert prefs["preferred_persona"] == "pirate"
 
-    @pytest.mark.asyncio
-    async def test_resolve_response_length_returns_user_preference_when_set(self, db_with_schema):
+    async def test_resolve_response_length_returns_user_preference_when_set(self, user_prefs):
         """Test resolve_response_length returns user preference when set."""
-        service = UserPreferencesService(db=db_with_schema)
-
-        await service.set_response_length(123456789, "detailed")
+        await user_prefs.set_response_length(123456789, "detailed")
 
-        length = await service.resolve_response_length(123456789)
+        length = await user_prefs.resolve_response_length(123456789)
         assert length == "detailed"
 
-    @pytest.mark.asyncio
-    async def test_resolve_preferred_persona_returns_none_when_unset(self, db_with_schema):
+    async def test_resolve_preferred_persona_returns_none_when_unset(self, user_prefs):
         """Test resolve_preferred_persona returns None when unset."""
-        service = UserPreferencesService(db=db_with_schema)
-
         # New user - no preferences set
-        persona = await service.resolve_preferred_persona(123456789)
+        persona = await user_prefs.resolve_preferred_persona(123456789)
         assert persona is None
 
-    @pytest.mark.asyncio
-    async def test_atomic_insert_or_ignore_prevents_race_conditions(self, db_with_schema):
+    async def test_atomic_insert_or_ignore_prevents_race_conditions(self, aiosqlite_db):
         """Test atomic INSERT OR IGNORE behavior for race conditions."""
-        import asyncio
-
-        service = UserPreferencesService(db=db_with_schema)
+        user_prefs = UserPreferencesService(db=aiosqlite_db)
 
         # Simulate concurrent access - should not raise duplicate key error
         results = await asyncio.gather(
-            service.get(123456789),
-            service.get(123456789),
-            service.get(123456789),
+            user_prefs.get(123456789),
+            user_prefs.get(123456789),
+            user_prefs.get(123456789),
         )
 
         # All should return same defaults
@@ -97,30 +130,24 @@ class TestUserPreferencesService:
             assert prefs["response_length"] == "balanced"
 
         # Verify only one row exists
-        rows = await db_with_schema.fetchall(
+        rows = await aiosqlite_db.fetchall(
             "SELECT COUNT(*) FROM user_preferences WHERE user_id = ?",
             ("123456789",),
         )
         assert rows[0][0] == 1
 
-    @pytest.mark.asyncio
-    async def test_invalid_response_length_rejected(self, db_with_schema):
+    async def test_invalid_response_length_rejected(self, user_prefs):
         """Test invalid response_length values are rejected."""
-        service = UserPreferencesService(db=db_with_schema)
-
         with pytest.raises(ValueError) as exc_info:
-            await service.set_response_length(123456789, "invalid")
+            await user_prefs.set_response_length(123456789, "invalid")
 
         assert "invalid" in str(exc_info.value).lower()
         assert "response length" in str(exc_info.value).lower()
 
-    @pytest.mark.asyncio
-    async def test_invalid_emoji_density_rejected(self, db_with_schema):
+    async def test_invalid_emoji_density_rejected(self, user_prefs):
         """Test invalid emoji_density values are rejected."""
-        service = UserPreferencesService(db=db_with_schema)
-
         with pytest.raises(ValueError) as exc_info:
-            await service.set_emoji_density(123456789, "invalid")
+            await user_prefs.set_emoji_density(123456789, "invalid")
 
         assert "invalid" in str(exc_info.value).lower()
         assert "emoji density" in str(exc_info.value).lower()
@@ -129,111 +156,310 @@ class TestUserPreferencesService:
 class TestUserPreferencesServiceSetters:
     """Tests for preference-specific setter methods."""
 
-    @pytest.mark.asyncio
-    async def test_set_response_length_valid_values(self, db_with_schema):
-        """Test set_response_length accepts all valid values."""
-        service = UserPreferencesService(db=db_with_schema)
+    @pytest.mark.parametrize("length", VALID_RESPONSE_LENGTHS_ORDER)
+    async def test_set_response_length_valid_values(self, user_prefs, length):
+        """Test set_response_length accepts every valid value."""
+        await user_prefs.set_response_length(123456789, length)
 
-        for length in VALID_RESPONSE_LENGTHS:
-            await service.set_response_length(123456789, length)
-            result = await service.resolve_response_length(123456789)
-            assert result == length
+        assert await user_prefs.resolve_response_length(123456789) == length
 
-    @pytest.mark.asyncio
-    async def test_set_emoji_density_valid_values(self, db_with_schema):
-        """Test set_emoji_density accepts all valid values."""
-        service = UserPreferencesService(db=db_with_schema)
+    @pytest.mark.parametrize("density", VALID_EMOJI_DENSITIES_ORDER)
+    async def test_set_emoji_density_valid_values(self, user_prefs, density):
+        """Test set_emoji_density accepts every valid value."""
+        await user_prefs.set_emoji_density(123456789, density)
 
-        for density in VALID_EMOJI_DENSITIES:
-            await service.set_emoji_density(123456789, density)
-            result = await service.resolve_emoji_density(123456789)
-            assert result == density
+        assert await user_prefs.resolve_emoji_density(123456789) == density
 
-    @pytest.mark.asyncio
-    async def test_set_preferred_persona_accepts_name(self, db_with_schema):
+    async def test_set_preferred_persona_accepts_name(self, user_prefs):
         """Test set_preferred_persona accepts persona name."""
-        service = UserPreferencesService(db=db_with_schema)
-
-        await service.set_preferred_persona(123456789, "pirate")
+        await user_prefs.set_preferred_persona(123456789, "pirate")
 
-        persona = await service.resolve_preferred_persona(123456789)
+        persona = await user_prefs.resolve_preferred_persona(123456789)
         assert persona == "pirate"
 
-    @pytest.mark.asyncio
-    async def test_set_preferred_persona_accepts_none_to_clear(self, db_with_schema):
+    async def test_set_preferred_persona_accepts_none_to_clear(self, user_prefs):
         """Test set_preferred_persona accepts None to clear."""
-        service = UserPreferencesService(db=db_with_schema)
-
         # Set a persona first
-        await service.set_preferred_persona(123456789, "pirate")
-        assert await service.resolve_preferred_persona(123456789) == "pirate"
+        await user_prefs.set_preferred_persona(123456789, "pirate")
+        assert await user_prefs.resolve_preferred_persona(123456789) == "pirate"
 
         # Clear with None
-        await service.set_preferred_persona(123456789, None)
-        assert await service.resolve_preferred_persona(123456789) is None
+        await user_prefs.set_preferred_persona(123456789, None)
+        assert await user_prefs.resolve_preferred_persona(123456789) is None
+
+
+class TestUserPreferencesServiceUpsert:
+    """Tests for single-statement preference writes."""
+
+    async def test_setter_issues_single_statement(self, db_with_schema, user_prefs):
+        """Test per-field setters write with exactly one SQL statement."""
+        with patch.object(db_with_schema, "execute", wraps=db_with_schema.execute) as spy:
+            await user_prefs.set_response_length(123456789, "concise")
+        assert spy.call_count == 1
+
+        # Existing row: still one statement, other keys preserved
+        await user_prefs.set_emoji_density(123456789, "lots")
+        with patch.object(db_with_schema, "execute", wraps=db_with_schema.execute) as spy:
+            await user_prefs.set_preferred_persona(123456789, "pirate")
+        assert spy.call_count == 1
+
+        prefs = await user_prefs.get(123456789)
+        assert prefs == {
+            "response_length": "concise",
+            "emoji_density": "lots",
+            "preferred_persona": "pirate",
+            "emoji_enforcement_enabled": True,
+        }
+
+    async def test_setter_recovers_from_corrupt_row(self, db_with_schema, user_prefs):
+        """Test a setter replaces unparseable stored JSON with defaults plus the new value."""
+        await db_with_schema.execute(
+            "INSERT INTO user_preferences (user_id, data_json) VALUES (?, ?)",
+            ("123456789", "not valid json"),
+        )
+
+        await user_prefs.set_response_length(123456789, "detailed")
+
+        prefs = await user_prefs.get(123456789)
+        assert prefs["response_length"] == "detailed"
+        assert prefs["emoji_density"] == "normal"
+
+    async def test_uses_orjson_when_available(self, user_prefs):
+        """Test the JSON blob goes through orjson when it is installed."""
+        fake_orjson = MagicMock()
+        fake_orjson.dumps.side_effect = lambda obj: json.dumps(obj).encode()
+        fake_orjson.loads.side_effect = json.loads
+        with patch("prism.services.user_preferences._orjson", fake_orjson):
+            await user_prefs.set_response_length(123456789, "concise")
+            prefs = await user_prefs.get(123456789)
+
+        assert prefs["response_length"] == "concise"
+        fake_orjson.dumps.assert_called()
+        fake_orjson.loads.assert_called()
+
+    async def test_set_many_invalidates_cache_and_validates_first(self, user_prefs):
+        """Test batch setters refresh cached users and reject bad input before writing."""
+        await user_prefs.get(1)  # cached as defaults
+
+        await user_prefs.set_emoji_density_many([(1, "none"), (2, "lots")])
+        assert await user_prefs.resolve_emoji_density(1) == "none"
+        assert await user_prefs.resolve_emoji_density(2) == "lots"
+
+        pairs = [(10 + i, length) for i, length in enumerate(VALID_RESPONSE_LENGTHS_ORDER)]
+        await user_prefs.set_response_length_many(pairs)
+        for user_id, length in pairs:
+            assert await user_prefs.resolve_response_length(user_id) == length
+
+        with pytest.raises(ValueError):
+            await user_prefs.set_response_length_many([(1, "concise"), (2, "huge")])
+        assert await user_prefs.resolve_response_length(1) == "balanced"
+
+    async def test_set_many_writes_once_and_keeps_other_keys(self, db_with_schema, user_prefs):
+        """Test set_many updates several keys in one statement without touching the rest."""
+        await user_prefs.set_preferred_persona(123456789, "pirate")
+
+        with patch.object(db_with_schema, "execute", wraps=db_with_schema.execute) as spy:
+            await user_prefs.set_many(123456789, response_length="detailed", emoji_density="none")
+        assert spy.call_count == 1
+
+        prefs = await user_prefs.get(123456789)
+        assert prefs["response_length"] == "detailed"
+        assert prefs["emoji_density"] == "none"
+        assert prefs["preferred_persona"] == "pirate"
+
+    async def test_set_many_rejects_bad_input(self, user_prefs):
+        """Test set_many validates names and values before writing anything."""
+        with pytest.raises(ValueError):
+            await user_prefs.set_many(123456789, response_length="concise", emoji_density="tons")
+        with pytest.raises(ValueError):
+            await user_prefs.set_many(123456789, favourite_colour="blue")
+
+        assert await user_prefs.resolve_response_length(123456789) == "balanced"
 
 
 class TestUserPreferencesServiceResolvers:
     """Tests for preference resolver methods."""
 
-    @pytest.mark.asyncio
-    async def test_resolve_response_length_returns_balanced_default(self, db_with_schema):
+    async def test_resolve_response_length_returns_balanced_default(self, user_prefs):
         """Test resolve_response_length returns 'balanced' by default."""
-        service = UserPreferencesService(db=db_with_schema)
-
-        length = await service.resolve_response_length(123456789)
+        length = await user_prefs.resolve_response_length(123456789)
         assert length == "balanced"
 
-    @pytest.mark.asyncio
-    async def test_resolve_emoji_density_returns_normal_default(self, db_with_schema):
+    async def test_resolve_emoji_density_returns_normal_default(self, user_prefs):
         """Test resolve_emoji_density returns 'normal' by default."""
-        service = UserPreferencesService(db=db_with_schema)
-
-        density = await service.resolve_emoji_density(123456789)
+        density = await user_prefs.resolve_emoji_density(123456789)
         assert density == "normal"
 
+    async def test_resolved_values_are_interned_vocabulary(self, user_prefs):
+        """Test values loaded from JSON are the same objects as the vocabulary entries."""
+        await user_prefs.set_response_length(123456789, "detailed")
+
+        length = await user_prefs.resolve_response_length(123456789)
+        density = await user_prefs.resolve_emoji_density(123456789)
+
+        assert length is VALID_RESPONSE_LENGTHS_ORDER[2]
+        assert density is VALID_EMOJI_DENSITIES_ORDER[2]
+
 
 class TestUserPreferencesServiceReset:
     """Tests for reset method."""
 
-    @pytest.mark.asyncio
-    async def test_reset_clears_user_preferences(self, db_with_schema):
+    async def test_reset_clears_user_preferences(self, user_prefs):
         """Test reset clears user back to defaults."""
-        service = UserPreferencesService(db=db_with_schema)
-
         # Set custom preferences
-        await service.set_response_length(123456789, "concise")
-        await service.set_emoji_density(123456789, "lots")
-        await service.set_preferred_persona(123456789, "pirate")
+        await user_prefs.set_response_length(123456789, "concise")
+        await user_prefs.set_emoji_density(123456789, "lots")
+        await user_prefs.set_preferred_persona(123456789, "pirate")
 
         # Verify they were set
-        assert await service.resolve_response_length(123456789) == "concise"
-        assert await service.resolve_emoji_density(123456789) == "lots"
-        assert await service.resolve_preferred_persona(123456789) == "pirate"
+        prefs = await user_prefs.get(123456789)
+        assert prefs["response_length"] == "concise"
+        assert prefs["emoji_density"] == "lots"
+        assert prefs["preferred_persona"] == "pirate"
 
         # Reset
-        await service.reset(123456789)
+        await user_prefs.reset(123456789)
 
         # Verify back to defaults
-        assert await service.resolve_response_length(123456789) == "balanced"
-        assert await service.resolve_emoji_density(123456789) == "normal"
-        assert await service.resolve_preferred_persona(123456789) is None
+        prefs = await user_prefs.get(123456789)
+        assert prefs["response_length"] == "balanced"
+        assert prefs["emoji_density"] == "normal"
+        assert prefs["preferred_persona"] is None
 
-    @pytest.mark.asyncio
-    async def test_reset_does_not_affect_other_users(self, db_with_schema):
+    async def test_reset_does_not_affect_other_users(self, user_prefs):
         """Test reset does not affect other users' preferences."""
-        service = UserPreferencesService(db=db_with_schema)
-
         # Set preferences for two users
-        await service.set_response_length(111, "concise")
-        await service.set_response_length(222, "detailed")
+        await user_prefs.set_response_length(111, "concise")
+        await user_prefs.set_response_length(222, "detailed")
 
         # Reset first user only
-        await service.reset(111)
+        await user_prefs.reset(111)
 
         # Verify first user is reset, second is unchanged
-        assert await service.resolve_response_length(111) == "balanced"
-        assert await service.resolve_response_length(222) == "detailed"
+        assert await user_prefs.resolve_response_length(111) == "balanced"
+        assert await user_prefs.resolve_response_length(222) == "detailed"
+
+
+class TestUserPreferencesServiceCache:
+    """Tests for the in-memory preferences cache."""
+
+    async def test_second_get_does_not_query_db(self, db_with_schema, user_prefs):
+        """Test a repeated get is served from cache without SQL."""
+        await user_prefs.get(123456789)
+        with patch.object(db_with_schema, "fetchone", wraps=db_with_schema.fetchone) as spy:
+            prefs = await user_prefs.get(123456789)
+
+        assert spy.call_count == 0
+        assert prefs["response_length"] == "balanced"
+
+    async def test_resolvers_share_one_load(self, db_with_schema, user_prefs):
+        """Test resolving all three preferences repeatedly costs a single DB read."""
+        await user_prefs.set_many(123456789, response_length="concise", emoji_density="minimal")
+
+        with patch.object(db_with_schema, "fetchone", wraps=db_with_schema.fetchone) as spy:
+            for _ in range(3):
+                assert await user_prefs.resolve_preferred_persona(123456789) is None
+                assert await user_prefs.resolve_response_length(123456789) == "concise"
+                assert await user_prefs.resolve_emoji_density(123456789) == "minimal"
+
+        assert spy.call_count == 1
+
+    async def test_load_existing_user_is_single_select(self, db_with_schema, user_prefs):
+        """Test a cache miss for a stored user reads the JSON row with one SELECT and no writes."""
+        await user_prefs.set_emoji_density(123456789, "lots")
+        service = UserPreferencesService(db=db_with_schema)  # cold cache
+
+        with patch.object(db_with_schema, "execute", wraps=db_with_schema.execute) as execute_spy, \
+                patch.object(db_with_schema, "fetchone", wraps=db_with_schema.fetchone) as fetch_spy:
+            prefs = await service.get(123456789)
+
+        assert prefs["emoji_density"] == "lots"
+        assert fetch_spy.call_count == 1
+        execute_spy.assert_not_called()
+
+    async def test_concurrent_gets_coalesce_into_one_query(self, aiosqlite_db):
+        """Test concurrent cache misses for one user share a single SELECT."""
+        user_prefs = UserPreferencesService(db=aiosqlite_db)
+
+        with patch.object(aiosqlite_db, "fetchone", wraps=aiosqlite_db.fetchone) as spy:
+            results = await asyncio.gather(
+                user_prefs.get(123456789),
+                user_prefs.get(123456789),
+                user_prefs.get(123456789),
+            )
+
+        assert spy.call_count == 1
+        assert all(prefs["response_length"] == "balanced" for prefs in results)
+        # Each caller gets its own dict
+        assert results[0] is not results[1]
+
+    async def test_concurrent_get_failure_propagates_to_all_waiters(self, db_with_schema, user_prefs):
+        """Test a failed coalesced load raises in every caller and is not cached."""
+        calls = 0
+
+        async def failing_fetchone(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise RuntimeError("db down")
+
+        with patch.object(db_with_schema, "fetchone", side_effect=failing_fetchone):
+            results = await asyncio.gather(
+                user_prefs.get(123456789),
+                user_prefs.get(123456789),
+                return_exceptions=True,
+            )
+
+        assert calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert user_prefs._inflight == {}
+        assert (await user_prefs.get(123456789))["response_length"] == "balanced"
+
+    @pytest.mark.parametrize("stored", ["detailed", None], ids=["existing_user", "new_user"])
+    async def test_get_after_write_does_not_join_older_load(self, aiosqlite_db, stored):
+        """Test a get issued after an awaited write sees the write, not an in-flight load."""
+        if stored is not None:
+            await UserPreferencesService(db=aiosqlite_db).set_response_length(42, stored)
+        user_prefs = UserPreferencesService(db=aiosqlite_db)  # cold cache
+
+        early = asyncio.create_task(user_prefs.get(42))
+        await asyncio.sleep(0)  # let the load start
+        await user_prefs.set_response_length(42, "concise")
+
+        assert (await user_prefs.get(42))["response_length"] == "concise"
+        await early
+        assert (await user_prefs.get(42))["response_length"] == "concise"
+
+    async def test_cancelled_get_does_not_cancel_other_waiters(self, aiosqlite_db):
+        """Test cancelling one caller leaves the shared load running for the rest."""
+        user_prefs = UserPreferencesService(db=aiosqlite_db)
+
+        first = asyncio.create_task(user_prefs.get(42))
+        second = asyncio.create_task(user_prefs.get(42))
+        await asyncio.sleep(0)  # both callers now wait on the same load
+        first.cancel()
+
+        prefs = await second
+        assert prefs["response_length"] == "balanced"
+        assert first.cancelled()
+        assert not second.cancelled()
+
+    async def test_cached_copy_is_not_shared(self, user_prefs):
+        """Test mutating a returned dict does not alter the cached entry."""
+        prefs = await user_prefs.get(123456789)
+        prefs["response_length"] = "detailed"
+
+        assert (await user_prefs.get(123456789))["response_length"] == "balanced"
+
+    async def test_cache_evicts_least_recently_used(self, user_prefs):
+        """Test the cache stays bounded by evicting the oldest user."""
+        with patch("prism.services.user_preferences._CACHE_MAX_USERS", 2):
+            await user_prefs.get(1)
+            await user_prefs.get(2)
+            await user_prefs.get(1)  # 1 becomes most recently used
+            await user_prefs.get(3)
+
+        assert list(user_prefs._cache) == [1, 3]
 
 
 # ==============================================================================
@@ -246,20 +472,16 @@ class TestEmojiDensityGuidanceMapping:
 
     def test_emoji_density_guidance_returns_correct_strings(self):
         """Test emoji density guidance mapping returns correct strings for each density."""
-        from prism.main import EMOJI_DENSITY_GUIDANCE
-
         # Test all valid density levels return appropriate guidance
         assert "Do not use any emojis" in EMOJI_DENSITY_GUIDANCE["none"]
         assert "sparingly" in EMOJI_DENSITY_GUIDANCE["minimal"]
         assert "naturally" in EMOJI_DENSITY_GUIDANCE["normal"]
         assert "generous" in EMOJI_DENSITY_GUIDANCE["lots"]
 
-    def test_emoji_density_guidance_covers_all_valid_densities(self):
+    @pytest.mark.parametrize("density", VALID_EMOJI_DENSITIES_ORDER)
+    def test_emoji_density_guidance_covers_all_valid_densities(self, density):
         """Test emoji density guidance covers all valid density levels."""
-        from prism.main import EMOJI_DENSITY_GUIDANCE
-
-        for density in VALID_EMOJI_DENSITIES:
-            assert density in EMOJI_DENSITY_GUIDANCE
+        assert density in EMOJI_DENSITY_GUIDANCE
 
 
 class TestResponseLengthMaxTokensMapping:
@@ -267,43 +489,33 @@ class TestResponseLengthMaxTokensMapping:
 
     def test_max_tokens_passed_correctly_for_concise(self):
         """Test max_tokens is set correctly for concise response length."""
-        from prism.main import RESPONSE_LENGTH_MAX_TOKENS
-
         assert RESPONSE_LENGTH_MAX_TOKENS["concise"] == 150
 
     def test_max_tokens_passed_correctly_for_balanced(self):
         """Test max_tokens is set correctly for balanced response length."""
-        from prism.main import RESPONSE_LENGTH_MAX_TOKENS
-
         assert RESPONSE_LENGTH_MAX_TOKENS["balanced"] == 500
 
     def test_max_tokens_passed_correctly_for_detailed(self):
         """Test max_tokens is None for detailed response length (no limit)."""
-        from prism.main import RESPONSE_LENGTH_MAX_TOKENS
-
         assert RESPONSE_LENGTH_MAX_TOKENS["detailed"] is None
 
 
 class TestUserPreferencesIntegration:
     """Integration tests for user preferences taking precedence (Task 2.1)."""
 
-    @pytest.mark.asyncio
-    async def test_persona_prefers_user_preference_over_guild_default(self, db_with_schema):
+    async def test_persona_prefers_user_preference_over_guild_default(self, user_prefs, guild_settings):
         """Test persona resolution prefers user preference over guild default."""
-        from prism.services.settings import SettingsService
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        guild_settings = SettingsService(db=db_with_schema)
-
-        # Set guild default persona
-        await guild_settings.set_persona(123456, "guild", None, "formal")
-
-        # Set user preferred persona
-        await user_prefs.set_preferred_persona(789, "casual")
+        # Set guild default persona and user preferred persona (independent rows)
+        await asyncio.gather(
+            guild_settings.set_persona(123456, "guild", None, "formal"),
+            user_prefs.set_preferred_persona(789, "casual"),
+        )
 
         # User preference should take precedence
-        user_persona = await user_prefs.resolve_preferred_persona(789)
-        guild_persona = await guild_settings.resolve_persona_name(123456, 0, 789)
+        user_persona, guild_persona = await asyncio.gather(
+            user_prefs.resolve_preferred_persona(789),
+            guild_settings.resolve_persona_name(123456, 0, 789),
+        )
 
         assert user_persona == "casual"
         assert guild_persona == "formal"
@@ -312,14 +524,8 @@ class TestUserPreferencesIntegration:
         # The integration in main.py checks user_persona first
         assert user_persona is not None  # User preference exists
 
-    @pytest.mark.asyncio
-    async def test_persona_falls_back_to_guild_when_user_unset(self, db_with_schema):
+    async def test_persona_falls_back_to_guild_when_user_unset(self, user_prefs, guild_settings):
         """Test persona falls back to guild default when user preference is unset."""
-        from prism.services.settings import SettingsService
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        guild_settings = SettingsService(db=db_with_schema)
-
         # Set guild default persona
         await guild_settings.set_persona(123456, "guild", None, "formal")
 
@@ -334,36 +540,36 @@ class TestUserPreferencesIntegration:
 class TestEmojiEnforcementIntegration:
     """Integration tests for emoji enforcement with density preference (Task 2.1)."""
 
-    @pytest.mark.asyncio
-    async def test_emoji_enforcement_skipped_when_density_none(self, db_with_schema):
+    async def test_emoji_enforcement_skipped_when_density_none(self, user_prefs):
         """Test emoji enforcement is skipped when user density is 'none'."""
-        user_prefs = UserPreferencesService(db=db_with_schema)
-
         # Set user emoji density to "none"
         await user_prefs.set_emoji_density(789, "none")
 
-        density = await user_prefs.resolve_emoji_density(789)
+        prefs = await user_prefs.get(789)
+
+        # main.py checks this flag before calling emoji enforcement
+        assert prefs["emoji_density"] == "none"
+        assert prefs["emoji_enforcement_enabled"] is False
 
-        # When density is "none", emoji enforcement should be skipped
-        # This is the condition checked in main.py before calling emoji enforcement
-        assert density == "none"
-        # The skip logic: if emoji_density != "none" then apply enforcement
-        should_skip_enforcement = density == "none"
-        assert should_skip_enforcement is True
+    @pytest.mark.parametrize("density_setting", VALID_EMOJI_DENSITIES_ORDER)
+    async def test_emoji_enforcement_flag_for_all_densities(self, user_prefs, density_setting):
+        """Test emoji_enforcement_enabled is derived correctly for every density."""
+        await user_prefs.set_emoji_density(789, density_setting)
+        prefs = await user_prefs.get(789)
 
-    @pytest.mark.asyncio
-    async def test_emoji_enforcement_applied_when_density_not_none(self, db_with_schema):
-        """Test emoji enforcement is applied when user density is not 'none'."""
-        user_prefs = UserPreferencesService(db=db_with_schema)
+        assert prefs["emoji_enforcement_enabled"] is (density_setting != "none")
 
-        # Test all non-"none" densities
-        for density_setting in ["minimal", "normal", "lots"]:
-            await user_prefs.set_emoji_density(789, density_setting)
-            density = await user_prefs.resolve_emoji_density(789)
+    async def test_emoji_enforcement_flag_not_persisted(self, db_with_schema, user_prefs):
+        """Test writing back a get() result does not store the derived flag."""
+        prefs = await user_prefs.get(789)
+        prefs["emoji_density"] = "none"
+        await user_prefs.set(789, prefs)
 
-            # Enforcement should be applied for non-"none" densities
-            should_apply_enforcement = density != "none"
-            assert should_apply_enforcement is True, f"Expected enforcement for density={density_setting}"
+        row = await db_with_schema.fetchone(
+            "SELECT data_json FROM user_preferences WHERE user_id = ?", ("789",)
+        )
+        assert "emoji_enforcement_enabled" not in row[0]
+        assert (await user_prefs.get(789))["emoji_enforcement_enabled"] is False
 
 
 # ==============================================================================
@@ -372,71 +578,44 @@ class TestEmojiEnforcementIntegration:
 
 
 class TestEndToEndResponseLengthMaxTokens:
-    """End-to-end test: User sets response_length='concise' -> Response uses correct max_tokens."""
+    """End-to-end test: User sets response_length -> Response uses correct max_tokens."""
 
-    @pytest.mark.asyncio
-    async def test_concise_response_length_uses_150_max_tokens(self, db_with_schema):
-        """Test that setting response_length to 'concise' results in max_tokens=150.
+    @pytest.mark.parametrize(
+        "length,expected",
+        [("concise", 150), ("balanced", 500), ("detailed", None)],
+    )
+    async def test_response_length_maps_to_max_tokens(self, user_prefs, length, expected):
+        """Test that each response_length results in the matching max_tokens.
 
         This simulates the end-to-end workflow:
-        1. User sets response_length preference to "concise"
-        2. When generating response, max_tokens=150 is used
+        1. User sets response_length preference
+        2. When generating response, the mapped max_tokens is used
+           (None means no limit)
         """
-        from prism.main import RESPONSE_LENGTH_MAX_TOKENS
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
         user_id = 999888777
 
-        # User sets preference to concise
-        await user_prefs.set_response_length(user_id, "concise")
+        # User sets preference
+        await user_prefs.set_response_length(user_id, length)
 
         # Resolve preference (as main.py does)
         response_length = await user_prefs.resolve_response_length(user_id)
         max_tokens = RESPONSE_LENGTH_MAX_TOKENS.get(response_length)
 
         # Verify the max_tokens that would be passed to chat_completion
-        assert response_length == "concise"
-        assert max_tokens == 150
-
-    @pytest.mark.asyncio
-    async def test_detailed_response_length_uses_no_max_tokens_limit(self, db_with_schema):
-        """Test that setting response_length to 'detailed' results in max_tokens=None.
-
-        This simulates:
-        1. User sets response_length preference to "detailed"
-        2. When generating response, max_tokens=None (no limit)
-        """
-        from prism.main import RESPONSE_LENGTH_MAX_TOKENS
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        user_id = 999888777
-
-        # User sets preference to detailed
-        await user_prefs.set_response_length(user_id, "detailed")
-
-        # Resolve preference
-        response_length = await user_prefs.resolve_response_length(user_id)
-        max_tokens = RESPONSE_LENGTH_MAX_TOKENS.get(response_length)
-
-        # Verify no max_tokens limit for detailed
-        assert response_length == "detailed"
-        assert max_tokens is None
+        assert response_length == length
+        assert max_tokens == expected
 
 
 class TestEndToEndEmojiDensityNone:
     """End-to-end test: User sets emoji_density='none' -> No emoji enforcement."""
 
-    @pytest.mark.asyncio
-    async def test_density_none_skips_all_emoji_processing(self, db_with_schema):
+    async def test_density_none_skips_all_emoji_processing(self, user_prefs):
         """Test that emoji_density='none' skips emoji enforcement pipeline.
 
         This simulates the end-to-end workflow:
         1. User sets emoji_density preference to "none"
         2. Main.py skips emoji enforcement entirely for this user
         """
-        from prism.main import EMOJI_DENSITY_GUIDANCE
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
         user_id = 111222333
 
         # User sets preference to none
@@ -458,8 +637,7 @@ class TestEndToEndEmojiDensityNone:
 class TestEndToEndPreferredPersona:
     """End-to-end test: User sets preferred_persona -> Response uses that persona."""
 
-    @pytest.mark.asyncio
-    async def test_user_preferred_persona_takes_precedence(self, db_with_schema):
+    async def test_user_preferred_persona_takes_precedence(self, user_prefs, guild_settings):
         """Test that user preferred persona overrides guild persona.
 
         This simulates the end-to-end workflow:
@@ -467,27 +645,22 @@ class TestEndToEndPreferredPersona:
         2. Guild has default persona "formal"
         3. When generating response, "pirate" persona is used
         """
-        from prism.services.settings import SettingsService
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        guild_settings = SettingsService(db=db_with_schema)
-
         user_id = 444555666
         guild_id = 123456
 
-        # Guild has a default persona
-        await guild_settings.set_persona(guild_id, "guild", None, "formal")
-
-        # User sets their preferred persona
-        await user_prefs.set_preferred_persona(user_id, "pirate")
+        # Guild has a default persona; user sets their preferred persona
+        await asyncio.gather(
+            guild_settings.set_persona(guild_id, "guild", None, "formal"),
+            user_prefs.set_preferred_persona(user_id, "pirate"),
+        )
 
         # Simulate main.py persona resolution logic (lines 339-346)
         user_persona = await user_prefs.resolve_preferred_persona(user_id)
-
-        if user_persona is not None:
-            persona_name = user_persona
-        else:
-            persona_name = await guild_settings.resolve_persona_name(guild_id, 0, user_id)
+        persona_name = (
+            await guild_settings.resolve_persona_name(guild_id, 0, user_id)
+            if user_persona is None
+            else user_persona
+        )
 
         # User's preferred persona should be used
         assert persona_name == "pirate"
@@ -496,7 +669,6 @@ class TestEndToEndPreferredPersona:
 class TestPersonaAutocompleteIncludesAllPersonas:
     """Integration test: Persona autocomplete includes all available personas."""
 
-    @pytest.mark.asyncio
     async def test_value_autocomplete_for_preferred_persona_structure(self):
         """Test autocomplete structure for preferred_persona returns expected format.
 
@@ -504,8 +676,6 @@ class TestPersonaAutocompleteIncludesAllPersonas:
         Since we can't easily mock the bot.prism_personas in tests, we verify
         the autocomplete function handles the preference type correctly.
         """
-        from prism.services.user_preferences import VALID_RESPONSE_LENGTHS, VALID_EMOJI_DENSITIES
-
         # Verify that response_length and emoji_density have defined autocomplete values
         # preferred_persona autocomplete is dynamic based on available personas
 
@@ -524,8 +694,7 @@ class TestPersonaAutocompleteIncludesAllPersonas:
 class TestEdgeCaseClearPreferredPersonaFallback:
     """Edge case: User clears preferred_persona -> Falls back to guild persona."""
 
-    @pytest.mark.asyncio
-    async def test_clearing_persona_preference_falls_back_to_guild(self, db_with_schema):
+    async def test_clearing_persona_preference_falls_back_to_guild(self, user_prefs, guild_settings):
         """Test that clearing user persona preference causes fallback to guild default.
 
         This simulates:
@@ -533,19 +702,14 @@ class TestEdgeCaseClearPreferredPersonaFallback:
         2. User clears preference (sets to None)
         3. Guild default persona "formal" is now used
         """
-        from prism.services.settings import SettingsService
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        guild_settings = SettingsService(db=db_with_schema)
-
         user_id = 777888999
         guild_id = 654321
 
-        # Setup: Guild has default persona
-        await guild_settings.set_persona(guild_id, "guild", None, "formal")
-
-        # User initially has a preferred persona
-        await user_prefs.set_preferred_persona(user_id, "pirate")
+        # Setup: Guild has default persona; user initially has a preferred persona
+        await asyncio.gather(
+            guild_settings.set_persona(guild_id, "guild", None, "formal"),
+            user_prefs.set_preferred_persona(user_id, "pirate"),
+        )
         assert await user_prefs.resolve_preferred_persona(user_id) == "pirate"
 
         # User clears their preference
@@ -553,21 +717,20 @@ class TestEdgeCaseClearPreferredPersonaFallback:
 
         # Simulate main.py resolution
         user_persona = await user_prefs.resolve_preferred_persona(user_id)
-
-        if user_persona is not None:
-            persona_name = user_persona
-        else:
-            persona_name = await guild_settings.resolve_persona_name(guild_id, 0, user_id)
+        assert user_persona is None
+        persona_name = (
+            await guild_settings.resolve_persona_name(guild_id, 0, user_id)
+            if user_persona is None
+            else user_persona
+        )
 
         # Should fall back to guild persona
-        assert user_persona is None
         assert persona_name == "formal"
 
 
 class TestMigrationV2ToV3:
     """Migration test: Database upgrades cleanly from v2 to v3."""
 
-    @pytest.mark.asyncio
     async def test_migration_creates_user_preferences_table(self, temp_db):
         """Test that migration v3 creates user_preferences table.
 
@@ -576,40 +739,14 @@ class TestMigrationV2ToV3:
         2. Migration v3 creates user_preferences table
         3. UserPreferencesService can use the table
         """
-        import aiosqlite
-
-        from prism.storage.migrations import (
-            apply_migrations,
-            get_schema_version,
-            init_schema_version,
-        )
-
         async with aiosqlite.connect(temp_db) as conn:
-            # Apply base schema (simulated v1-v2 state)
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    guild_id TEXT PRIMARY KEY,
-                    data_json TEXT NOT NULL
-                )
-            """)
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY,
-                    guild_id TEXT,
-                    channel_id TEXT,
-                    user_id TEXT,
-                    role TEXT,
-                    content TEXT
-                )
-            """)
-            await conn.commit()
-
-            # Initialize to v2 (before user_preferences existed)
+            # Same journaling as Database.init, so each commit isn't a full fsync
+            await conn.execute("PRAGMA journal_mode = WAL;")
+            await conn.execute("PRAGMA synchronous = NORMAL;")
+            # Apply base schema (simulated v1-v2 state) and pin the version to v2,
+            # i.e. before user_preferences existed
             await init_schema_version(conn)
-            # Set to v2 explicitly
-            await conn.execute("DELETE FROM schema_version")
-            await conn.execute("INSERT INTO schema_version (version) VALUES (?)", (2,))
-            await conn.commit()
+            await conn.executescript(BASE_V2_DDL)
 
             # Verify we're at v2
             version = await get_schema_version(conn)
@@ -617,7 +754,7 @@ class TestMigrationV2ToV3:
 
             # Verify user_preferences doesn't exist yet
             cursor = await conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='user_preferences'"
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_preferences' LIMIT 1"
             )
             row = await cursor.fetchone()
             assert row is None, "user_preferences should not exist at v2"
@@ -631,63 +768,82 @@ class TestMigrationV2ToV3:
 
             # Verify user_preferences table now exists
             cursor = await conn.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='user_preferences'"
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_preferences' LIMIT 1"
             )
             row = await cursor.fetchone()
             assert row is not None, "user_preferences should exist after v3 migration"
 
             # Verify table structure
-            cursor = await conn.execute("PRAGMA table_info(user_preferences)")
-            columns = await cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            assert "user_id" in column_names
-            assert "data_json" in column_names
-            assert "updated_at" in column_names
+            cursor = await conn.execute(
+                "SELECT COUNT(*) FROM pragma_table_info('user_preferences') "
+                "WHERE name IN ('user_id', 'data_json', 'updated_at')"
+            )
+            (n,) = await cursor.fetchone()
+            assert n == 3, "user_preferences should have user_id, data_json and updated_at"
+
+    async def test_failed_migration_rolls_back(self):
+        """Test a migration that raises leaves neither its DDL nor a version bump."""
+        async def _broken_v3(conn):
+            await conn.execute("CREATE TABLE user_preferences (user_id TEXT PRIMARY KEY)")
+            raise RuntimeError("boom")
+
+        async with aiosqlite.connect(":memory:") as conn:
+            await init_schema_version(conn)
+            await conn.executescript(BASE_V2_DDL)
+
+            with patch("prism.storage.migrations.MIGRATIONS", [None, None, _broken_v3]):
+                with pytest.raises(RuntimeError):
+                    await apply_migrations(conn)
+
+            assert await get_schema_version(conn) == 2
+            cursor = await conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_preferences' LIMIT 1"
+            )
+            assert await cursor.fetchone() is None
 
 
 class TestUserPreferencesAcrossMultipleGuilds:
     """Edge case: User with preference interacts in multiple guilds."""
 
-    @pytest.mark.asyncio
-    async def test_user_preferences_persist_across_guilds(self, db_with_schema):
+    async def test_user_preferences_persist_across_guilds(self, user_prefs, guild_settings):
         """Test that user preferences apply globally, not per-guild.
 
         This verifies:
         1. User sets preference once
         2. Preference applies in all guilds user interacts in
         """
-        from prism.services.settings import SettingsService
-
-        user_prefs = UserPreferencesService(db=db_with_schema)
-        guild_settings = SettingsService(db=db_with_schema)
-
         user_id = 123123123
         guild_a = 111111
         guild_b = 222222
         guild_c = 333333
 
         # Setup different guild defaults
-        await guild_settings.set_persona(guild_a, "guild", None, "guild_a_persona")
-        await guild_settings.set_persona(guild_b, "guild", None, "guild_b_persona")
-        await guild_settings.set_persona(guild_c, "guild", None, "guild_c_persona")
+        await guild_settings.set_personas_bulk([
+            (guild_a, "guild_a_persona"),
+            (guild_b, "guild_b_persona"),
+            (guild_c, "guild_c_persona"),
+        ])
+
+        # User sets their preferences (once, globally)
+        await user_prefs.set_many(
+            user_id,
+            preferred_persona="user_choice",
+            response_length="concise",
+            emoji_density="minimal",
+        )
 
-        # User sets their preferred persona (once, globally)
-        await user_prefs.set_preferred_persona(user_id, "user_choice")
-        await user_prefs.set_response_length(user_id, "concise")
-        await user_prefs.set_emoji_density(user_id, "minimal")
+        # User preferences depend only on the user, so resolve them once
+        user_persona, user_length, user_density = await asyncio.gather(
+            user_prefs.resolve_preferred_persona(user_id),
+            user_prefs.resolve_response_length(user_id),
+            user_prefs.resolve_emoji_density(user_id),
+        )
+        assert user_persona == "user_choice"
+        assert user_length == "concise"
+        assert user_density == "minimal"
 
         # Verify user preference applies in ALL guilds
         for guild_id in [guild_a, guild_b, guild_c]:
-            # Simulate main.py resolution for this guild
-            user_persona = await user_prefs.resolve_preferred_persona(user_id)
-            user_length = await user_prefs.resolve_response_length(user_id)
-            user_density = await user_prefs.resolve_emoji_density(user_id)
-
-            # User preferences are the same regardless of guild
-            assert user_persona == "user_choice"
-            assert user_length == "concise"
-            assert user_density == "minimal"
-
             # Guild defaults exist but are not used when user has preference
             guild_persona = await guild_settings.resolve_persona_name(guild_id, 0, user_id)
             assert guild_persona != user_persona  # Different from user choice